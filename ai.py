@@ -0,0 +1,613 @@
+"""
+  Snackade AI - stronger computer players built on the engine rules
+
+  LookaheadPlayer scores each move by the space it leaves: a flood fill of the
+  cells it can reach before its opponents (a Voronoi split of the board),
+  searched a few of its own moves ahead within a time budget per tick.
+  Only the flood fill buffers carry over from tick to tick: the opponent
+  distances and every leaf's fill are worked out afresh each tick, since
+  every player's move changes the board they are filled over.
+
+  A TranspositionTable keyed by the game box's Zobrist hash, with the
+  search's own moves on top, keeps the best move found at each position
+  searched. Each deepening pass tries the last pass's best move first, and
+  a position already searched as deep, as when a seeded game is replayed
+  with a shared table, is answered at once. The key covers the cells the
+  search's path took, so no other path in a search reaches the same key
+  and leaf scores are not stored.
+
+  MCTSPlayer runs Monte Carlo tree search over the real game rules, random
+  snacks included, spread over a pool of worker processes that all stop at
+  a fixed wall clock deadline each tick.
+
+MIT License - see snackade.py
+"""
+
+import math
+import os
+import random
+from array import array
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, wait
+from time import perf_counter, time
+
+from engine import (DIR_CODE, DIRECTIONS, GRID_CELLS, GRID_XSIZE, GRID_YSIZE, GRID_YCELLS, GVAL_CLEAR,
+                    GVAL_SNACK, ComputerPlayer, GameBox, Match, Player, Snack, cell_key, dir_map, grid_cell)
+
+# Grid cell step for a direction, and the direction for a step
+STEPS = {d: d[0] * GRID_YCELLS + d[1] for d in ComputerPlayer.RIGHT_TURN}
+STEP_DIR = {step: d for d, step in STEPS.items()}
+# Grid cell step for a stored move code
+CODE_STEPS = {DIR_CODE[d]: step for d, step in STEPS.items()}
+
+RIGHT_STEP = {STEPS[d]: STEPS[turn] for d, turn in ComputerPlayer.RIGHT_TURN.items()}
+LEFT_STEP = {STEPS[d]: STEPS[turn] for d, turn in ComputerPlayer.LEFT_TURN.items()}
+
+# Score of a move that crashes, plus the number of moves survived before it
+CRASH_SCORE = -100000
+
+# Hash keys for how many moves ahead a search position is
+_keys = random.Random(0x5EA4C4)
+MOVED_KEYS = [_keys.getrandbits(64) for moved in range(64)]
+
+
+def passable(value):
+    """
+    Can a head move onto a cell with this grid value without crashing
+    """
+    return value == GVAL_CLEAR or value == GVAL_SNACK
+
+
+def in_arena(gx, gy):
+    """
+    Is a grid location inside the border
+    """
+    return 0 < gx < GRID_XSIZE and 0 < gy < GRID_YSIZE
+
+
+class Timeout(Exception):
+    """
+    Raised inside a search when the tick budget runs out
+    """
+
+
+class TranspositionTable:
+    """
+    Fixed size cache of search results keyed by position hash. Each bucket
+    holds two entries: one kept for the deepest search, replaced only by one
+    as deep or by an entry left over from an earlier search, and one that
+    always takes the newest result, so deep results survive while recent
+    ones stay reachable. Entries live in flat arrays, so the memory used is
+    fixed when the table is made.
+    """
+    def __init__(self, bits=16):
+        """
+        Initialize table
+        :param bits:    2 ** bits buckets, 2 entries each
+        """
+        self.mask = (1 << bits) - 1
+        size = 2 << bits
+        # a key of 0 marks an empty entry
+        self.keys = array('Q', bytes(8 * size))
+        self.depths = array('b', bytes(size))
+        self.scores = array('i', bytes(4 * size))
+        self.moves = array('b', bytes(size))
+        self.ages = array('B', bytes(size))
+        self.age = 0
+        self.probes = 0
+        self.hits = 0
+        self.answered = 0
+        self.stores = 0
+        self.replaced = 0
+        # counts when the current search started
+        self.search_start = (0, 0, 0)
+
+    def new_search(self):
+        """
+        Start a new search, entries from earlier ones can be replaced first
+        """
+        self.age = (self.age + 1) & 0xff
+        self.search_start = (self.probes, self.hits, self.answered)
+
+    def probe(self, key, depth=0):
+        """
+        Look up a position. An entry searched less deep than asked for is
+        still returned, for its move to be tried first.
+        :param key:     position hash
+        :param depth:   search depth wanted, entries as deep count as answered
+        :return:        (depth, score, move) or None
+        """
+        self.probes += 1
+        i = (key & self.mask) << 1
+        keys = self.keys
+        if keys[i] != key:
+            i += 1
+            if keys[i] != key:
+                return None
+        self.hits += 1
+        if self.depths[i] >= depth:
+            self.answered += 1
+        self.ages[i] = self.age
+        return self.depths[i], self.scores[i], self.moves[i]
+
+    def store(self, key, depth, score, move=-1):
+        """
+        Save a search result
+        :param key:     position hash
+        :param depth:   moves searched below the position
+        :param score:   its score
+        :param move:    best move code, -1 for none
+        """
+        i = (key & self.mask) << 1
+        keys = self.keys
+        if keys[i] != key and keys[i + 1] == key:
+            i += 1
+        elif keys[i] != key and keys[i] and depth < self.depths[i] and self.ages[i] == self.age:
+            # the deep entry stays, the newest one goes in the other slot
+            i += 1
+        if keys[i] and keys[i] != key:
+            self.replaced += 1
+        keys[i] = key
+        self.depths[i] = depth
+        self.scores[i] = score
+        self.moves[i] = move
+        self.ages[i] = self.age
+        self.stores += 1
+
+    def clear(self):
+        for table in (self.keys, self.depths, self.scores, self.moves, self.ages):
+            table[:] = array(table.typecode, bytes(table.itemsize * len(table)))
+        self.probes = self.hits = self.answered = self.stores = self.replaced = 0
+        self.search_start = (0, 0, 0)
+
+    def hit_rate(self):
+        return self.hits / self.probes if self.probes else 0.0
+
+    def search_stats(self):
+        """
+        Lookups since new_search()
+        :return:    dict of probes, hits, hits answered outright and hit rate
+        """
+        probes, hits, answered = (now - then for now, then in
+                                  zip((self.probes, self.hits, self.answered), self.search_start))
+        return {'probes': probes, 'hits': hits, 'answered': answered,
+                'hit_rate': hits / probes if probes else 0.0}
+
+    def memory(self):
+        """
+        Bytes held by the entries
+        """
+        return sum(t.itemsize * len(t) for t in (self.keys, self.depths, self.scores, self.moves, self.ages))
+
+    def stats(self):
+        """
+        :return:    dict of entry counts, lookups and memory use
+        """
+        return {'capacity': len(self.keys), 'used': len(self.keys) - self.keys.count(0),
+                'probes': self.probes, 'hits': self.hits, 'answered': self.answered,
+                'hit_rate': self.hit_rate(),
+                'stores': self.stores, 'replaced': self.replaced, 'bytes': self.memory()}
+
+
+class LookaheadPlayer(ComputerPlayer):
+    """
+    Computer player that searches its next few moves and keeps to open space
+    """
+    # Points per cell of territory, and for being closer to a reachable snack
+    TERRITORY_WEIGHT = 4
+    SNACK_WEIGHT = 30
+
+    # Penalty for moving next to an opponent's head, where it may also move
+    HEAD_ON_PENALTY = 1000
+
+    def __init__(self, gbox, gx, gy, colour, budget=0.02, max_depth=4, table=None):
+        """
+        Initialize lookahead player
+        :param budget:      seconds allowed to choose each move
+        :param max_depth:   most moves ahead to search
+        :param table:       TranspositionTable to cache searches in, players
+                            with the same weights can share one, default a new one
+        """
+        super().__init__(gbox, gx, gy, colour)
+        self.budget = budget
+        self.max_depth = max_depth
+        self.table = TranspositionTable() if table is None else table
+        self.last_depth = 0
+        self.last_time = 0.0
+        # table lookups in the last choose(), see TranspositionTable.search_stats
+        self.last_search = {}
+
+        # flood fill buffers kept between ticks, stamped instead of cleared,
+        # though the fills themselves are redone every tick
+        self._stamp = 0
+        self._seen = [0] * GRID_CELLS
+        self._dist = [0] * GRID_CELLS
+        self._mine = [0] * GRID_CELLS
+        self._my_dist = [0] * GRID_CELLS
+        self._queue = [0] * GRID_CELLS
+        self._deadline = 0.0
+
+    def _opponent_distances(self):
+        # multi-source flood fill from the opponent heads into self._dist
+        grid = self.gbox.grid
+        seen, dist, queue = self._seen, self._dist, self._queue
+        self._stamp += 1
+        stamp = self._stamp
+        end = 0
+        for o in self.opponents:
+            # an opponent that moved earlier this tick may already be in the border
+            if o.status == Player.Status.COLLISION or not in_arena(o.gx, o.gy):
+                continue
+            head = grid_cell(o.gx, o.gy)
+            seen[head] = stamp
+            dist[head] = 0
+            queue[end] = head
+            end += 1
+        start = 0
+        while start < end:
+            cell = queue[start]
+            start += 1
+            step = dist[cell] + 1
+            for next_cell in (cell - 1, cell + 1, cell - GRID_YCELLS, cell + GRID_YCELLS):
+                if seen[next_cell] != stamp and passable(grid[next_cell]):
+                    seen[next_cell] = stamp
+                    dist[next_cell] = step
+                    queue[end] = next_cell
+                    end += 1
+        return stamp
+
+    def _evaluate(self, head, moved, opponent_stamp):
+        """
+        Score the board with our head at a cell
+        :param head:            our hypothetical head cell
+        :param moved:           moves we have made ahead of the opponents
+        :param opponent_stamp:  stamp of the opponent flood fill in self._dist
+        """
+        grid = self.gbox.grid
+        seen, dist = self._seen, self._dist
+        mine, my_dist, queue = self._mine, self._my_dist, self._queue
+        self._stamp += 1
+        stamp = self._stamp
+        snack = self.gbox.snack_location
+        snack_cell = grid_cell(*snack) if snack else -1
+        snack_dist = None
+
+        # count the cells we reach before any opponent does
+        territory = 0
+        mine[head] = stamp
+        my_dist[head] = moved
+        queue[0] = head
+        start, end = 0, 1
+        while start < end:
+            cell = queue[start]
+            start += 1
+            step = my_dist[cell]
+            if cell == snack_cell:
+                snack_dist = step
+            step += 1
+            for next_cell in (cell - 1, cell + 1, cell - GRID_YCELLS, cell + GRID_YCELLS):
+                if mine[next_cell] == stamp or not passable(grid[next_cell]):
+                    continue
+                mine[next_cell] = stamp
+                if seen[next_cell] == opponent_stamp and dist[next_cell] <= step:
+                    continue
+                my_dist[next_cell] = step
+                territory += 1
+                queue[end] = next_cell
+                end += 1
+
+        score = territory * self.TERRITORY_WEIGHT
+        if snack_dist is not None:
+            score += max(self.SNACK_WEIGHT - snack_dist, 1)
+        return score
+
+    def _key(self, marks, head, step, moved):
+        # the real position's hash with the search's own moves on top
+        gbox, slot = self.gbox, self.slot
+        return (gbox.hash ^ marks ^ gbox.head_keys[slot][head] ^
+                gbox.dir_keys[slot][STEP_DIR[step]] ^ MOVED_KEYS[moved])
+
+    def _search(self, head, step, depth, moved, opponent_stamp, marks):
+        if perf_counter() > self._deadline:
+            raise Timeout()
+        if depth == 0:
+            # no other path reaches the same key, so leaves are not stored
+            return self._evaluate(head, moved, opponent_stamp)
+        key = self._key(marks, head, step, moved)
+        steps = (step, RIGHT_STEP[step], LEFT_STEP[step])
+        entry = self.table.probe(key, depth)
+        if entry:
+            if entry[0] >= depth:
+                return entry[1]
+            # searched less deep by the last pass, try its best move first
+            if entry[2] >= 0 and CODE_STEPS[entry[2]] != step:
+                first = CODE_STEPS[entry[2]]
+                steps = (first,) + tuple(s for s in steps if s != first)
+
+        grid = self.gbox.grid
+        best = best_step = None
+        for next_step in steps:
+            cell = head + next_step
+            value = grid[cell]
+            if not passable(value):
+                continue
+            # mark the move on the grid and always undo it
+            grid[cell] += 1
+            try:
+                score = self._search(cell, next_step, depth - 1, moved + 1, opponent_stamp,
+                                     marks ^ cell_key(cell, value) ^ cell_key(cell, value + 1))
+            finally:
+                grid[cell] -= 1
+            if best is None or score > best:
+                best, best_step = score, next_step
+        if best is None:
+            # nowhere to go, no move to keep
+            return CRASH_SCORE + moved
+        self.table.store(key, depth, best, DIR_CODE[STEP_DIR[best_step]])
+        return best
+
+    def _preferred(self):
+        # the direction the simple ComputerPlayer would take towards a snack
+        if self.gbox.snack_location:
+            snack_x, snack_y = self.gbox.snack_location
+            sx, sy = dir_map(snack_x - self.gx), dir_map(snack_y - self.gy)
+            return STEPS[self.SNACK_TURN[(sx, sy)][(self.dx, self.dy)]]
+        return STEPS[(self.dx, self.dy)]
+
+    def choose(self):
+        """
+        Pick the direction to move this tick
+        :return:    dx, dy
+        """
+        started = perf_counter()
+        self._deadline = started + self.budget
+        grid = self.gbox.grid
+        head = grid_cell(self.gx, self.gy)
+        step = STEPS[(self.dx, self.dy)]
+        table = self.table
+        table.new_search()
+
+        # a position already searched as deep, e.g. replaying a seed, is answered at once
+        root = self._key(0, head, step, 0)
+        entry = table.probe(root, self.max_depth)
+        if entry and entry[0] >= self.max_depth and entry[2] >= 0:
+            self.last_depth = entry[0]
+            self.last_time = perf_counter() - started
+            self.last_search = table.search_stats()
+            return DIRECTIONS[entry[2]]
+        preferred = self._preferred()
+
+        # cells an opponent could move into next tick risk a head on crash
+        danger = set()
+        for o in self.opponents:
+            if o.status != Player.Status.COLLISION and in_arena(o.gx, o.gy):
+                o_head = grid_cell(o.gx, o.gy)
+                danger.update(o_head + s for s in STEPS.values())
+
+        candidates = [s for s in (step, RIGHT_STEP[step], LEFT_STEP[step])
+                      if passable(grid[head + s])]
+        if not candidates:
+            self.last_search = table.search_stats()
+            return STEP_DIR[step]
+        # try the snack direction first so it wins ties on the first pass
+        candidates.sort(key=lambda s: s != preferred)
+
+        opponent_stamp = self._opponent_distances()
+        best_step = candidates[0]
+        depth = 0
+        try:
+            for depth in range(1, self.max_depth + 1):
+                scores = {}
+                # the last pass's pick first, so a pass cut short has still
+                # searched it deeper and can be trusted with what it has
+                candidates.sort(key=lambda s: s != best_step)
+                for s in candidates:
+                    cell = head + s
+                    value = grid[cell]
+                    grid[cell] += 1
+                    try:
+                        scores[s] = self._search(cell, s, depth - 1, 1, opponent_stamp,
+                                                 cell_key(cell, value) ^ cell_key(cell, value + 1))
+                    finally:
+                        grid[cell] -= 1
+                    if cell in danger:
+                        scores[s] -= self.HEAD_ON_PENALTY
+                best_step = max(candidates, key=lambda s: scores[s])
+                self.last_depth = depth
+                # the root entry holds the move picked, head on risk included
+                table.store(root, depth, scores[best_step], DIR_CODE[STEP_DIR[best_step]])
+        except Timeout:
+            if depth > 1 and scores:
+                # the last pick was searched deeper first, switch only to a move beating it
+                best_step = max(scores, key=lambda s: scores[s])
+
+        self.last_time = perf_counter() - started
+        self.last_search = table.search_stats()
+        return STEP_DIR[best_step]
+
+
+
+def capture(player):
+    """
+    Capture the game as seen by a player, for rebuilding in another process
+    :param player:  player whose view it is, listed first with its opponents after
+    :return:        picklable state tuple
+    """
+    gbox = player.gbox
+    grid = bytearray(gbox.grid)
+    snack = None
+    if gbox.snack_location:
+        grid[grid_cell(*gbox.snack_location)] -= GVAL_SNACK
+        # captured mid tick, an opponent that moved first may be on the
+        # snack, which it eats at the end of the tick
+        if all((p.gx, p.gy) != gbox.snack_location for p in player.opponents):
+            snack = (gbox.snack_location, gbox.snack_value)
+    players = [(p.gx, p.gy, p.dx, p.dy, tuple(p.trail))
+               for p in [player] + player.opponents]
+    return bytes(grid), players, snack
+
+
+def load(match, state):
+    """
+    Set a match up from a captured state
+    """
+    grid, players, snack = state
+    match.gbox.grid_load(grid)
+    match.snack = Snack(match.gbox, *snack) if snack else None
+    match.alive = list(match.players)
+    for p, (gx, gy, dx, dy, trail) in zip(match.players, players):
+        p.gx, p.gy = gx, gy
+        p.dx, p.dy = dx, dy
+        p.trail = deque(trail)
+        p.tail = divmod(trail[0], GRID_YCELLS)
+        p.status = Player.Status.CLEAR
+        p.rehash_head(cleared=True)
+
+
+class RolloutPlayer(ComputerPlayer):
+    """
+    ComputerPlayer that takes a forced turn when given one, and otherwise
+    sometimes turns at random so rollouts vary
+    """
+    RANDOM_TURN = 0.1
+
+    def __init__(self, gbox):
+        super().__init__(gbox, 1, 1, None)
+        self.turn = None
+
+    def move(self):
+        if self.turn is not None:
+            d = (self.dx, self.dy)
+            self.set_direction(*(d, self.RIGHT_TURN[d], self.LEFT_TURN[d])[self.turn])
+            self.turn = None
+            Player.move(self)
+        elif random.random() < self.RANDOM_TURN:
+            d = (self.dx, self.dy)
+            self.set_direction(*random.choice((self.RIGHT_TURN[d], self.LEFT_TURN[d])))
+            Player.move(self)
+        else:
+            super().move()
+
+
+def mcts_search(state, deadline, seed, tree_depth=8, horizon=40, exploration=1.4):
+    """
+    Open loop MCTS over our own turns until a wall clock deadline. Each
+    iteration replays the tree moves from the root state, with opponents and
+    snacks random, so the tree holds action sequences rather than states.
+    :param state:       captured state, see capture()
+    :param deadline:    time() to stop searching
+    :param seed:        random seed for this search
+    :return:            ([visits, wins] for straight/right/left, rollouts)
+    """
+    random.seed(seed)
+    gbox = GameBox()
+    players = [RolloutPlayer(gbox) for p in state[1]]
+    match = Match(gbox, players)
+    match.rng.seed(seed)
+    me = players[0]
+    stats = {(): [0, 0.0]}
+    rollouts = 0
+
+    while time() < deadline:
+        load(match, state)
+        path = ()
+        result = None
+        ticks = 0
+        # walk down the tree by UCB, adding one new node
+        while len(path) < tree_depth:
+            children = [path + (a,) for a in range(3)]
+            new = [c for c in children if c not in stats]
+            if new:
+                path = random.choice(new)
+                stats[path] = [0, 0.0]
+            else:
+                log_visits = math.log(stats[path][0])
+                path = max(children, key=lambda c: stats[c][1] / stats[c][0] +
+                           exploration * math.sqrt(log_visits / stats[c][0]))
+            me.turn = path[-1]
+            result = match.tick()
+            ticks += 1
+            if result.game_over or new or me not in match.alive:
+                break
+
+        # then play it out with the rollout policy, as long as we are in it
+        while not result.game_over and me in match.alive and ticks < horizon:
+            result = match.tick()
+            ticks += 1
+
+        if me in match.alive:
+            # last one standing, or still going at the horizon
+            reward = 1.0 if result.game_over else 0.5
+        elif result.game_over and not match.alive:
+            # crashed on the same tick as everyone left, a draw
+            reward = 0.5
+        else:
+            reward = 0.0
+        for i in range(len(path) + 1):
+            node = stats[path[:i]]
+            node[0] += 1
+            node[1] += reward
+        rollouts += 1
+
+    return [stats.get((a,), [0, 0.0]) for a in range(3)], rollouts
+
+
+class MCTSPlayer(ComputerPlayer):
+    """
+    Hard computer player running parallel Monte Carlo tree search
+    """
+    # Seconds kept back from the budget for sending results between processes
+    MARGIN = 0.01
+
+    def __init__(self, gbox, gx, gy, colour, budget=0.06, workers=None):
+        """
+        Initialize MCTS player
+        :param budget:  seconds allowed to choose each move
+        :param workers: worker processes, default one per core
+        """
+        super().__init__(gbox, gx, gy, colour)
+        self.budget = budget
+        self.workers = workers or os.cpu_count() or 1
+        self.pool = ProcessPoolExecutor(self.workers)
+        self.rollouts = 0
+        self.rollouts_per_second = 0.0
+        # rollouts over every move, for throughput across games
+        self.total_rollouts = 0
+        # start the workers now rather than on the first move
+        wait([self.pool.submit(abs, 0) for i in range(self.workers)])
+
+    def close(self):
+        self.pool.shutdown(cancel_futures=True)
+
+    def choose(self):
+        """
+        Pick the direction to move this tick
+        :return:    dx, dy
+        """
+        started = time()
+        deadline = started + self.budget
+        state = capture(self)
+        futures = [self.pool.submit(mcts_search, state, deadline - self.MARGIN,
+                                    random.getrandbits(32))
+                   for i in range(self.workers)]
+        # anything not back by the deadline is dropped
+        done, late = wait(futures, timeout=max(deadline - time(), 0))
+        for future in late:
+            future.cancel()
+
+        visits = [0, 0, 0]
+        self.rollouts = 0
+        for future in done:
+            children, rollouts = future.result()
+            self.rollouts += rollouts
+            self.total_rollouts += rollouts
+            for a, (n, wins) in enumerate(children):
+                visits[a] += n
+        self.rollouts_per_second = self.rollouts / max(time() - started, 1e-6)
+
+        d = (self.dx, self.dy)
+        if not any(visits):
+            # no results in time, steer like the simple computer player
+            return super().choose()
+        turn = max(range(3), key=lambda a: visits[a])
+        return (d, self.RIGHT_TURN[d], self.LEFT_TURN[d])[turn]
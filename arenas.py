@@ -0,0 +1,371 @@
+#!/usr/bin/python3
+"""
+  Snackade arena server - many matches sharing one event loop
+
+  Every arena is an independent match with its own tick deadline. Rather
+  than a task sleeping per arena, one timer wheel holds every deadline and a
+  single task wakes once per wheel slot to tick the arenas that are due, so
+  thousands of arenas cost little more than the ticks themselves. Seats are
+  played by ComputerPlayers or by remote clients, which speak the netplay.py
+  lockstep protocol, so the game and the netplay bot can join:
+
+      python arenas.py --arenas 2000                  # computer arenas only
+      python arenas.py --arenas 100 --remote 1        # a seat each for clients
+      SNACKADE_SERVER=localhost:7777 python snackade.py
+
+  Every few seconds the server reports ticks per second, how late ticks ran
+  after their deadline, ticks missed by a whole period or more, and the
+  scheduler load: the share of the time spent ticking arenas.
+
+MIT License - see snackade.py
+"""
+
+import argparse
+import asyncio
+import math
+
+from engine import DIRECTIONS, TICK_RATE, GameBox, Match, start_positions
+from netplay import (INPUT_DELAY, PING, RESTART_DELAY, START, TICK, NetComputerPlayer, pack_codes,
+                     read_message)
+
+# Seconds covered by each timer wheel slot, and slots in the wheel
+WHEEL_RESOLUTION = 0.005
+WHEEL_SLOTS = 256
+# Seconds between reports
+REPORT_INTERVAL = 5.0
+# Most players a tick message has room for with remote seats, 2 bits each
+MAX_REMOTE_PLAYERS = 4
+
+
+def percentile(ordered, fraction):
+    # as tournament.percentile, kept here so the server does not load the tournament runner
+    if not ordered:
+        return 0.0
+    return ordered[min(int(fraction * len(ordered)), len(ordered) - 1)]
+
+
+class TimerWheel:
+    """
+    Hashed timer wheel: each slot holds the items due in one resolution
+    step, and items further ahead than the wheel goes round wait in their
+    slot for later turns. Scheduling is O(1) and expiring is O(items due),
+    with items fired up to one resolution step after their time, never
+    before it beyond rounding error.
+    """
+    def __init__(self, start, resolution=WHEEL_RESOLUTION, slots=WHEEL_SLOTS):
+        """
+        Initialize wheel
+        :param start:       time of the first slot
+        :param resolution:  seconds per slot
+        :param slots:       slots in the wheel
+        """
+        self.start = start
+        self.resolution = resolution
+        self.slots = [[] for i in range(slots)]
+        # step of the next slot to expire, counted from start
+        self.current = 0
+        self.count = 0
+
+    def schedule(self, when, item):
+        """
+        Add an item to expire at a time
+        """
+        # a time on a slot boundary stays in that slot despite float rounding
+        step = max(math.ceil((when - self.start) / self.resolution - 1e-6), self.current)
+        self.slots[step % len(self.slots)].append((step, item))
+        self.count += 1
+
+    def next_time(self):
+        """
+        Time the next slot is due
+        """
+        return self.start + self.current * self.resolution
+
+    def expire(self, now):
+        """
+        Take the items due by a time
+        :return:    list of items, in slot order
+        """
+        due = []
+        last = int((now - self.start) / self.resolution)
+        slots = self.slots
+        while self.current <= last:
+            current = self.current
+            index = current % len(slots)
+            slot = slots[index]
+            if slot:
+                if all(step <= current for step, item in slot):
+                    # usual case, the whole slot is due
+                    slots[index] = []
+                    due.extend(item for step, item in slot)
+                else:
+                    slots[index] = [entry for entry in slot if entry[0] > current]
+                    due.extend(item for step, item in slot if step <= current)
+            self.current += 1
+        self.count -= len(due)
+        return due
+
+
+class SchedulerStats:
+    """
+    Tick lateness and scheduler load, collected between reports
+    """
+    def __init__(self, now):
+        self.since = now
+        self.lateness = []
+        self.missed = 0
+        self.busy = 0.0
+        self.wakeups = 0
+
+    def report(self, now, arenas):
+        """
+        Summarize the stats since the last report and start again
+        :return:    dict of rates and lateness percentiles in seconds
+        """
+        elapsed = max(now - self.since, 1e-9)
+        ordered = sorted(self.lateness)
+        summary = {'arenas': arenas, 'ticks_per_second': len(ordered) / elapsed,
+                   'lateness_p50': percentile(ordered, 0.5), 'lateness_p99': percentile(ordered, 0.99),
+                   'lateness_max': ordered[-1] if ordered else 0.0,
+                   'missed': self.missed, 'load': self.busy / elapsed,
+                   'wakeups_per_second': self.wakeups / elapsed}
+        self.__init__(now)
+        return summary
+
+
+class Arena:
+    """
+    One match on the server, ticked by the timer wheel
+    """
+    def __init__(self, server, players=2, remote=0):
+        """
+        Initialize arena
+        :param server:  ArenaServer it runs on
+        :param players: players in the match
+        :param remote:  seats for remote clients, the rest are computer players
+        """
+        self.server = server
+        self.gbox = GameBox()
+        self.match = Match(self.gbox, [NetComputerPlayer(self.gbox, gx, gy, None)
+                                       for (gx, gy), d in start_positions(players)])
+        self.remote = remote
+        # client writer per seat, None for a computer player
+        self.writers = [None] * players
+        # seats taken during a game, played by the computer until the next one
+        self.waiting = set()
+        # direction changes waiting for their tick, per seat: tick -> code
+        self.pending = [{} for i in range(players)]
+        self.tick = 0
+        self.deadline = 0.0
+        self.playing = False
+        # not on the timer wheel, waiting for remote clients
+        self.idle = True
+        self.games = 0
+
+    def seat(self, writer):
+        """
+        Seat a remote client in the first open remote seat
+        :return:    seat index, or None when the remote seats are full
+        """
+        taken = sum(1 for w in self.writers if w is not None)
+        if taken >= self.remote:
+            return None
+        index = self.writers.index(None)
+        self.writers[index] = writer
+        if self.playing:
+            self.waiting.add(index)
+        return index
+
+    def ready(self):
+        return all(w is not None for w in self.writers[:self.remote])
+
+    def leave(self, index):
+        # a computer player takes over the seat
+        self.writers[index] = None
+        self.waiting.discard(index)
+        self.pending[index].clear()
+
+    def start(self, now):
+        """
+        Start a game
+        :param now: time the game starts, ticks are scheduled from it
+        :return:    time of the first tick
+        """
+        self.match.reset()
+        self.tick = 0
+        self.playing = True
+        self.waiting.clear()
+        for pending in self.pending:
+            pending.clear()
+        players = len(self.match.players)
+        for index, writer in enumerate(self.writers):
+            if writer:
+                writer.write(START.pack(b'S', index, players, self.match.seed, self.server.delay))
+        self.deadline = now + self.server.period * self.server.delay
+        return self.deadline
+
+    def step(self):
+        """
+        Play one tick
+        :return:    True when the game is over
+        """
+        self.tick += 1
+        for index, (p, writer, pending) in enumerate(zip(self.match.players, self.writers, self.pending)):
+            if writer is None or index in self.waiting:
+                p.set_direction(*p.choose())
+            elif pending:
+                # the latest change due by this tick, late ones included
+                due = [tick for tick in pending if tick <= self.tick]
+                if due:
+                    p.set_direction(*DIRECTIONS[pending[max(due)]])
+                    for tick in due:
+                        del pending[tick]
+        if self.remote:
+            message = TICK.pack(b'T', self.tick, pack_codes((p.dx, p.dy) for p in self.match.players))
+            for index, writer in enumerate(self.writers):
+                if writer and index not in self.waiting:
+                    writer.write(message)
+        return self.match.tick().game_over
+
+    def wake(self, now, due):
+        """
+        Run whatever is due at a wheel wake up
+        :param now: time of the wake up
+        :param due: time the wheel slot was due, new schedules start from it
+                    so they keep to slot boundaries rather than running late
+        :return:    time to be woken next, or None to wait for clients
+        """
+        if not self.playing:
+            if not self.ready():
+                self.idle = True
+                return None
+            return self.start(due)
+        stats = self.server.stats
+        late = now - self.deadline
+        stats.lateness.append(late)
+        if late >= self.server.period:
+            stats.missed += 1
+        if self.step():
+            self.playing = False
+            self.games += 1
+            return due + RESTART_DELAY
+        # keep to the fixed schedule rather than a period after this wake up
+        self.deadline += self.server.period
+        return self.deadline
+
+
+class ArenaServer:
+    """
+    Runs arenas on one timer wheel and seats remote clients in them
+    """
+    def __init__(self, arenas=1000, players=2, remote=0, rate=TICK_RATE, delay=INPUT_DELAY,
+                 resolution=WHEEL_RESOLUTION):
+        """
+        Initialize server
+        :param arenas:      number of arenas
+        :param players:     players per arena
+        :param remote:      seats per arena for remote clients
+        :param rate:        ticks per second in every arena
+        :param delay:       ticks ahead remote direction changes are applied on
+        :param resolution:  seconds per timer wheel slot
+        """
+        if remote and players > MAX_REMOTE_PLAYERS:
+            raise ValueError('at most {} players in arenas with remote seats'.format(MAX_REMOTE_PLAYERS))
+        self.period = 1 / rate
+        self.delay = delay
+        self.resolution = resolution
+        self.arenas = [Arena(self, players, remote) for i in range(arenas)]
+        self.wheel = None
+        self.stats = None
+
+    async def _client(self, reader, writer):
+        loop = asyncio.get_running_loop()
+        for arena in self.arenas:
+            index = arena.seat(writer)
+            if index is not None:
+                break
+        else:
+            writer.close()
+            return
+        if arena.idle and arena.ready():
+            arena.idle = False
+            self.wheel.schedule(loop.time(), arena)
+        try:
+            while True:
+                message = await read_message(reader)
+                if message[0] == b'D':
+                    _, tick, code = message
+                    arena.pending[index][tick] = code
+                elif message[0] == b'P':
+                    writer.write(PING.pack(*message))
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            arena.leave(index)
+            writer.close()
+
+    async def run(self, host='localhost', port=7777, duration=None, report=REPORT_INTERVAL, on_report=print):
+        """
+        Tick the arenas until cancelled
+        :param duration:    seconds to run for, None for no limit
+        :param report:      seconds between reports
+        :param on_report:   called with each report's dict
+        """
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        self.wheel = wheel = TimerWheel(now, self.resolution)
+        self.stats = stats = SchedulerStats(now)
+        # spread the first ticks over a period so the arenas do not all tick at once
+        count = len(self.arenas)
+        for i, arena in enumerate(self.arenas):
+            if arena.ready():
+                arena.idle = False
+                wheel.schedule(now + self.period * i / count, arena)
+        server = None
+        if any(arena.remote for arena in self.arenas):
+            server = await asyncio.start_server(self._client, host, port, backlog=1024)
+        stop = now + duration if duration else None
+        next_report = now + report
+        try:
+            while stop is None or loop.time() < stop:
+                await asyncio.sleep(max(wheel.next_time() - loop.time(), 0))
+                now = loop.time()
+                stats.wakeups += 1
+                due = wheel.next_time()
+                for arena in wheel.expire(now):
+                    when = arena.wake(now, due)
+                    if when is not None:
+                        wheel.schedule(when, arena)
+                stats.busy += loop.time() - now
+                if now >= next_report:
+                    on_report(stats.report(now, count))
+                    next_report += report
+        finally:
+            if server:
+                server.close()
+
+
+def show(summary):
+    print('{arenas} arenas  {ticks_per_second:7.0f} ticks/s  lateness ms p50 {p50:5.1f} p99 {p99:5.1f} '
+          'max {max:5.1f}  missed {missed}  load {load:4.0%}'.format(
+              p50=summary['lateness_p50'] * 1000, p99=summary['lateness_p99'] * 1000,
+              max=summary['lateness_max'] * 1000, **summary))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Snackade arena server')
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=7777)
+    parser.add_argument('--arenas', type=int, default=1000)
+    parser.add_argument('--players', type=int, default=2, help='players per arena')
+    parser.add_argument('--remote', type=int, default=0, help='seats per arena for remote clients')
+    parser.add_argument('--rate', type=float, default=TICK_RATE, help='ticks per second')
+    parser.add_argument('--duration', type=float, default=None, help='seconds to run, default no limit')
+    parser.add_argument('--report', type=float, default=REPORT_INTERVAL, help='seconds between reports')
+    args = parser.parse_args()
+    server = ArenaServer(args.arenas, args.players, args.remote, args.rate)
+    asyncio.run(server.run(args.host, args.port, args.duration, args.report, show))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,273 @@
+"""
+  Snackade batch engine - many matches stepped in lockstep with NumPy
+
+  BatchMatch holds N boards as one (N, GRID_XSIZE+1, GRID_YSIZE+1) array and
+  advances all of them each tick with array operations. The rules follow
+  engine.Match: the same additive grid values, the order players move and
+  check status in, snack spawn/expiry odds and the ComputerPlayer turning
+  logic including the SNACK_TURN lookup. Boards that finish can be reset in
+  place so the batch keeps running for AI evaluation:
+
+      batch = BatchMatch(10000, seed=1)
+      batch.run(1000)
+      print(batch.wins.sum(axis=0), batch.draws.sum())
+
+MIT License - see snackade.py
+"""
+
+import numpy as np
+
+from engine import (GRID_XSIZE, GRID_YSIZE, GRID_YCELLS, GRID_CELLS, EMPTY_GRID,
+                    GVAL_PLAYER, GVAL_SNACK, START_POSITIONS, DIRECTIONS, DIR_CODE,
+                    ComputerPlayer, Match)
+
+# Directions are held as codes (engine.DIR_CODE) so turns become table lookups.
+# Step through the flat grid for each direction code, cell = x * GRID_YCELLS + y
+DIR_STEP = np.array([dx * GRID_YCELLS + dy for dx, dy in DIRECTIONS], dtype=np.int32)
+
+RIGHT_TURN = np.array([DIR_CODE[ComputerPlayer.RIGHT_TURN[d]] for d in DIRECTIONS], dtype=np.int8)
+LEFT_TURN = np.array([DIR_CODE[ComputerPlayer.LEFT_TURN[d]] for d in DIRECTIONS], dtype=np.int8)
+
+# SNACK_TURN as [sx+1, sy+1, direction code]; snack on the head keeps direction
+SNACK_TURN = np.empty((3, 3, 4), dtype=np.int8)
+SNACK_TURN[:, :] = np.arange(4)
+for (_sx, _sy), _turns in ComputerPlayer.SNACK_TURN.items():
+    for _d, _turn in _turns.items():
+        SNACK_TURN[_sx + 1, _sy + 1, DIR_CODE[_d]] = DIR_CODE[_turn]
+
+# Longest possible trail - every interior cell stacked with the biggest snack
+TRAIL_SIZE = 2048
+
+
+def init_grids(n):
+    """
+    Build n empty grids with borders, same layout as engine.init_grid
+    :param n:   number of boards
+    :return:    int16 array (n, GRID_XSIZE+1, GRID_YSIZE+1)
+    """
+    empty = np.frombuffer(EMPTY_GRID, dtype=np.uint8).astype(np.int16)
+    return np.tile(empty, (n, 1)).reshape(n, GRID_XSIZE + 1, GRID_YSIZE + 1)
+
+
+class BatchMatch:
+    """
+    Steps N two player matches at once
+    """
+    def __init__(self, n, computer=(True, True), seed=None, auto_reset=True):
+        """
+        Initialize batch
+        :param n:           number of boards
+        :param computer:    per player, True to steer like ComputerPlayer, False
+                            to keep heading the set direction
+        :param seed:        seed for the batch random generator
+        :param auto_reset:  reset finished boards at the end of each tick
+        """
+        self.n = n
+        self.players = len(computer)
+        self.computer = list(computer)
+        self.auto_reset = auto_reset
+        self.rng = np.random.default_rng(seed)
+
+        self.grid = init_grids(n)
+        self.cells = self.grid.reshape(n, GRID_CELLS)
+        self.head = np.zeros((n, self.players), dtype=np.int32)
+        self.direction = np.zeros((n, self.players), dtype=np.int8)
+        self.trail = np.zeros((n, self.players, TRAIL_SIZE), dtype=np.int16)
+        self.trail_start = np.zeros((n, self.players), dtype=np.int32)
+        self.trail_len = np.zeros((n, self.players), dtype=np.int32)
+        self.snack = np.full(n, -1, dtype=np.int32)
+        self.snack_value = np.zeros(n, dtype=np.int8)
+        self.points = np.zeros((n, self.players), dtype=np.int32)
+        self.crashed = np.zeros((n, self.players), dtype=bool)
+        self.ticks = np.zeros(n, dtype=np.int32)
+
+        # results accumulate over every game played on a board
+        self.wins = np.zeros((n, self.players), dtype=np.int32)
+        self.draws = np.zeros(n, dtype=np.int32)
+        self.games = np.zeros(n, dtype=np.int32)
+        self.total_ticks = 0
+
+        self._rows = np.arange(n)
+        self._empty = init_grids(1).reshape(GRID_CELLS)
+        # snacks only spawn inside the border ring, see engine.Snack
+        self._snack_area = np.zeros((GRID_XSIZE + 1, GRID_YSIZE + 1), dtype=bool)
+        self._snack_area[2:GRID_XSIZE, 2:GRID_YSIZE] = True
+        self._snack_area = self._snack_area.reshape(GRID_CELLS)
+
+        self.reset()
+
+    def reset(self, boards=None):
+        """
+        Put boards back at the start of a game
+        :param boards:  bool mask or indices of boards, None for all
+        """
+        if boards is None:
+            boards = self._rows
+        self.cells[boards] = self._empty
+        self.snack[boards] = -1
+        self.snack_value[boards] = 0
+        self.points[boards] = 0
+        self.crashed[boards] = False
+        self.ticks[boards] = 0
+        self.trail_start[boards] = 0
+        for p, ((gx, gy), d) in enumerate(START_POSITIONS[:self.players]):
+            cell = gx * GRID_YCELLS + gy
+            # a new head is stacked three deep just like Player.set_head
+            self.head[boards, p] = cell
+            self.direction[boards, p] = DIR_CODE[d]
+            self.trail[boards, p, :3] = cell
+            self.trail_len[boards, p] = 3
+            self.cells[boards, cell] += 3 * GVAL_PLAYER
+
+    def set_directions(self, p, directions, boards=None):
+        """
+        Set direction codes for a player that is not computer steered
+        :param p:           player index
+        :param directions:  direction code(s), index into DIRECTIONS
+        :param boards:      boards to set, None for all
+        """
+        if boards is None:
+            boards = self._rows
+        self.direction[boards, p] = directions
+
+    def _spawn_snacks(self, boards):
+        # pick uniformly among clear cells by giving each a random key, which is
+        # what the rejection loop in engine.Snack does without the retries
+        clear = (self.cells[boards] == 0) & self._snack_area
+        keys = self.rng.random(clear.shape)
+        keys[~clear] = -1.0
+        cells = keys.argmax(axis=1)
+        has_room = clear.any(axis=1)
+        boards, cells = boards[has_room], cells[has_room]
+        self.snack[boards] = cells
+        self.snack_value[boards] = self.rng.integers(1, 4, len(boards))
+        self.cells[boards, cells] += GVAL_SNACK
+
+    def _snack_event(self, active):
+        event = active & (self.rng.integers(1, Match.SNACK_CHANCE + 1, self.n) == Match.SNACK_CHANCE)
+        has_snack = self.snack >= 0
+        expire = event & has_snack & \
+            (self.rng.integers(1, Match.SNACK_EXPIRE + 1, self.n) == Match.SNACK_EXPIRE)
+        boards = np.nonzero(expire)[0]
+        self.cells[boards, self.snack[boards]] -= GVAL_SNACK
+        self.snack[boards] = -1
+
+        boards = np.nonzero(event & ~has_snack)[0]
+        if len(boards):
+            self._spawn_snacks(boards)
+
+    def _steer(self, boards, p):
+        # ComputerPlayer.move - head for the snack, turn if that crashes
+        head = self.head[boards, p]
+        d = self.direction[boards, p].astype(np.intp)
+        snack = self.snack[boards]
+        new_d = d.copy()
+        has_snack = snack >= 0
+        if has_snack.any():
+            sb = np.nonzero(has_snack)[0]
+            sx = np.sign(snack[sb] // GRID_YCELLS - head[sb] // GRID_YCELLS) + 1
+            sy = np.sign(snack[sb] % GRID_YCELLS - head[sb] % GRID_YCELLS) + 1
+            new_d[sb] = SNACK_TURN[sx, sy, d[sb]]
+
+        ahead = self.cells[boards, head + DIR_STEP[new_d]]
+        blocked = (ahead != 0) & (ahead < GVAL_SNACK)
+        if blocked.any():
+            bb = np.nonzero(blocked)[0]
+            bd, bh, bboards = d[bb], head[bb], boards[bb]
+            # try straight, right then left, the loop leaves left if none clear
+            choice = LEFT_TURN[bd].astype(np.intp)
+            for options in (LEFT_TURN[bd], RIGHT_TURN[bd], bd):
+                clear = self.cells[bboards, bh + DIR_STEP[options]] == 0
+                choice = np.where(clear, options, choice)
+            new_d[bb] = choice
+        self.direction[boards, p] = new_d
+
+    def _push(self, boards, p, cells):
+        end = (self.trail_start[boards, p] + self.trail_len[boards, p]) % TRAIL_SIZE
+        self.trail[boards, p, end] = cells
+        self.trail_len[boards, p] += 1
+        self.cells[boards, cells] += GVAL_PLAYER
+
+    def _move(self, boards, p):
+        # Player.move - new head on, oldest tail segment off
+        head = self.head[boards, p] + DIR_STEP[self.direction[boards, p]]
+        self.head[boards, p] = head
+        self._push(boards, p, head)
+        start = self.trail_start[boards, p]
+        tail = self.trail[boards, p, start]
+        self.trail_start[boards, p] = (start + 1) % TRAIL_SIZE
+        self.trail_len[boards, p] -= 1
+        self.cells[boards, tail] -= GVAL_PLAYER
+
+    def _update_status(self, boards, p):
+        # Player.update_status then the chomp handling from Match.tick
+        head = self.head[boards, p]
+        value = self.cells[boards, head]
+        self.crashed[boards, p] = ((value > GVAL_PLAYER) & (value < GVAL_SNACK)) | \
+            (value == GVAL_PLAYER + GVAL_PLAYER + GVAL_SNACK)
+        chomp = value == GVAL_PLAYER + GVAL_SNACK
+        if chomp.any():
+            cb = boards[chomp]
+            ch = head[chomp]
+            grow = self.snack_value[cb]
+            self.points[cb, p] += grow
+            for segment in range(1, grow.max() + 1):
+                more = grow >= segment
+                self._push(cb[more], p, ch[more])
+            self.cells[cb, ch] -= GVAL_SNACK
+            self.snack[cb] = -1
+
+    def tick(self):
+        """
+        Advance every unfinished board one move
+        :return:    bool mask of boards that finished this tick
+        """
+        active = ~self.crashed.any(axis=1)
+        self._snack_event(active)
+        boards = np.nonzero(active)[0]
+
+        # players move one after the other so later players see earlier moves
+        for p in range(self.players):
+            if self.computer[p]:
+                self._steer(boards, p)
+            self._move(boards, p)
+
+        for p in range(self.players):
+            self._update_status(boards, p)
+
+        self.ticks[boards] += 1
+        self.total_ticks += len(boards)
+
+        crashed = self.crashed[boards]
+        over = crashed.any(axis=1)
+        finished = np.zeros(self.n, dtype=bool)
+        finished[boards] = over
+        done = boards[over]
+        self.wins[done] += ~crashed[over]
+        self.draws[done] += crashed[over].all(axis=1)
+        self.games[done] += 1
+
+        if self.auto_reset and len(done):
+            self.reset(done)
+        return finished
+
+    def run(self, ticks):
+        """
+        Tick the whole batch a number of times
+        :param ticks:   number of ticks
+        :return:        number of board ticks simulated
+        """
+        start = self.total_ticks
+        for i in range(ticks):
+            self.tick()
+        return self.total_ticks - start
+
+
+if __name__ == '__main__':
+    from time import perf_counter
+    batch = BatchMatch(10000, seed=1)
+    start = perf_counter()
+    simulated = batch.run(500)
+    elapsed = perf_counter() - start
+    print('{} games, {:.0f} ticks/s, wins {} draws {}'.format(
+        batch.games.sum(), simulated / elapsed, batch.wins.sum(axis=0), batch.draws.sum()))
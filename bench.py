@@ -0,0 +1,330 @@
+#!/usr/bin/python3
+"""
+  Snackade benchmarks - time the game's hot paths, headless
+
+  Micro benchmarks time single calls (the grid, player moves on short and
+  very long snakes, snack placement, the computer player, tone building,
+  drawing) and the macro benchmark times whole play() games per tick, with
+  SDL's dummy video and audio drivers so no window or sound card is needed.
+  Results are saved as JSON, and comparing against an earlier run flags any
+  benchmark that got slower by more than a threshold:
+
+      python bench.py --out base.json
+      python bench.py --compare base.json --threshold 0.1
+      python bench.py player_move_long snack_full      # just these
+
+  Each benchmark reports the best and median time per call over its repeats,
+  the best being the steadiest to compare.
+
+MIT License - see snackade.py
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+from statistics import median
+from time import perf_counter, strftime
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+
+import pygame
+
+import snackade
+from engine import (GRID_XSIZE, GRID_YSIZE, ComputerPlayer, GameBox, Match, Player, Snack, init_grid,
+                    start_positions)
+
+# Seconds each repeat of a self calibrating benchmark should take, and repeats per benchmark
+TARGET_TIME = 0.005
+REPEAT = 50
+# Slow down, as a fraction, that counts as a regression
+THRESHOLD = 0.1
+
+# Benchmark name -> (setup function, calls per repeat or None to calibrate, counted)
+BENCHMARKS = {}
+
+
+def benchmark(name, number=None, counted=False):
+    """
+    Register a benchmark. Its setup function returns (run, reset): run is
+    the call timed, reset is called untimed before each repeat, or None.
+    :param number:  calls of run per repeat, default enough for TARGET_TIME
+    :param counted: run returns how many operations it did, e.g. ticks
+    """
+    def register(setup):
+        BENCHMARKS[name] = (setup, number, counted)
+        return setup
+    return register
+
+
+def cycle():
+    """
+    A closed path through every cell inside the border: down and up the
+    columns below the top row, then back along the top row
+    :return:    list of (gx, gy)
+    """
+    path = []
+    for gx in range(1, GRID_XSIZE):
+        rows = range(2, GRID_YSIZE) if gx % 2 else range(GRID_YSIZE - 1, 1, -1)
+        path += [(gx, gy) for gy in rows]
+    path += [(gx, 1) for gx in range(GRID_XSIZE - 1, 0, -1)]
+    return path
+
+
+class CycleSnake:
+    """
+    A player going round and round cycle(), so it can move for ever
+    """
+    def __init__(self, length):
+        self.path = cycle()
+        self.gbox = GameBox()
+        gx, gy = self.path[0]
+        self.player = Player(self.gbox, gx, gy, None, [])
+        self.step = 0
+        # grow a segment a move until long enough
+        while len(self.player.trail) < length:
+            self.move()
+            self.player.grow(1)
+
+    def move(self):
+        self.step = (self.step + 1) % len(self.path)
+        p = self.player
+        gx, gy = self.path[self.step]
+        p.set_direction(gx - p.gx, gy - p.gy)
+        p.move()
+
+
+# Snake lengths for the short and very long snake benchmarks, the long one
+# fills all but a few cells of the arena
+SHORT = 3
+LONG = len(cycle()) - 8
+
+
+@benchmark('init_grid')
+def bench_init_grid():
+    grid = init_grid(None)
+    return (lambda: init_grid(grid)), None
+
+
+def bench_move(length):
+    snake = CycleSnake(length)
+    return snake.move, None
+
+
+def bench_update_status(length):
+    snake = CycleSnake(length)
+    return snake.player.update_status, None
+
+
+def bench_grow(length):
+    snake = CycleSnake(length)
+    state = snake.gbox.snapshot(), snake.player.snapshot()
+
+    def reset():
+        snake.gbox.restore(state[0])
+        snake.player.restore(state[1])
+    return (lambda: snake.player.grow(1, 1)), reset
+
+
+for size, length in (('short', SHORT), ('long', LONG)):
+    # grow stacks segments on the head cell, so few calls per repeat
+    benchmark('player_move_' + size)(lambda length=length: bench_move(length))
+    benchmark('player_grow_' + size, number=100)(lambda length=length: bench_grow(length))
+    benchmark('player_update_status_' + size)(lambda length=length: bench_update_status(length))
+
+
+def bench_snack(gbox):
+    rng = random.Random(1)
+
+    def place():
+        Snack(gbox, rng=rng).clear()
+    return place, None
+
+
+@benchmark('snack_empty')
+def bench_snack_empty():
+    return bench_snack(GameBox())
+
+
+@benchmark('snack_full')
+def bench_snack_full():
+    snake = CycleSnake(LONG)
+    if not snake.gbox.free_count():
+        raise RuntimeError('no free snack cells left on the board')
+    return bench_snack(snake.gbox)
+
+
+@benchmark('computer_move', number=20)
+def bench_computer_move():
+    # a seeded game twenty ticks in, rewound before every repeat, with no
+    # snack to walk onto as the match is not ticked to eat it
+    gbox = GameBox()
+    players = [ComputerPlayer(gbox, gx, gy, None) for (gx, gy), d in start_positions(2)]
+    match = Match(gbox, players)
+    match.reset(1)
+    while match.ticks < 20 or match.snack:
+        match.tick()
+    state = match.snapshot()
+    return players[0].move, lambda: match.restore(state)
+
+
+@benchmark('tone_build_samples')
+def bench_tone():
+    tone = snackade.Tone(snackade.NoteLoop.NOTE_NAMES['C3'])
+    return tone.build_samples, None
+
+
+@benchmark('draw_player')
+def bench_draw_player():
+    gbox = snackade.GameBox(screen)
+    p = Player(gbox, 5, 5, snackade.GREEN, [])
+    p.set_direction(1, 0)
+    p.move()
+    return (lambda: gbox.draw_player(p)), snackade.dirty.rects.clear
+
+
+class SteadyClock:
+    """
+    Stands in for the game clock, every frame lasts one tick so play() ticks
+    each frame without waiting
+    """
+    def __init__(self, rate):
+        self.period = 1000 / rate
+
+    def tick(self, framerate=0):
+        return self.period
+
+
+@benchmark('play_tick', number=1, counted=True)
+def bench_play():
+    gbox = snackade.GameBox(screen)
+    match = Match(gbox, [ComputerPlayer(gbox, gx, gy, colour) for ((gx, gy), d), colour
+                         in zip(start_positions(2), snackade.PLAYER_COLOURS)])
+    seeds = iter(range(1, 1 << 30))
+
+    def game():
+        match.reset(next(seeds))
+        gbox.clear_game_area()
+        snackade.play(gbox, match)
+        return match.ticks
+    return game, None
+
+
+def measure(name, repeat=REPEAT):
+    """
+    Run one benchmark
+    :return:    dict of best and median seconds per call, calls timed
+    """
+    setup, number, counted = BENCHMARKS[name]
+    run, reset = setup()
+    if number is None:
+        # double the calls until a repeat takes long enough to time
+        number = 1
+        while True:
+            start = perf_counter()
+            for i in range(number):
+                run()
+            if perf_counter() - start >= TARGET_TIME:
+                break
+            number *= 2
+    times = []
+    calls = 0
+    for r in range(repeat):
+        if reset:
+            reset()
+        if counted:
+            start = perf_counter()
+            done = sum(run() for i in range(number))
+            times.append((perf_counter() - start) / done)
+            calls += done
+        else:
+            start = perf_counter()
+            for i in range(number):
+                run()
+            times.append((perf_counter() - start) / number)
+            calls += number
+    return {'best': min(times), 'median': median(times), 'calls': calls}
+
+
+def compare(results, baseline, threshold=THRESHOLD):
+    """
+    Compare best times against an earlier run
+    :return:    list of (name, old best, new best, change), slower ones beyond threshold first
+    """
+    changes = []
+    for name, result in results.items():
+        if name in baseline:
+            old = baseline[name]['best']
+            changes.append((name, old, result['best'], result['best'] / old - 1))
+    changes.sort(key=lambda c: (c[3] <= threshold, c[0]))
+    return changes
+
+
+def fmt(seconds):
+    for unit, scale in (('s', 1), ('ms', 1e3), ('us', 1e6)):
+        if seconds * scale >= 1:
+            return '{:8.2f} {}'.format(seconds * scale, unit)
+    return '{:8.1f} ns'.format(seconds * 1e9)
+
+
+screen = None
+
+
+def main():
+    global screen
+    parser = argparse.ArgumentParser(description='Benchmark Snackade')
+    parser.add_argument('names', nargs='*', help='benchmarks to run, default all')
+    parser.add_argument('--list', action='store_true', help='list the benchmarks')
+    parser.add_argument('--repeat', type=int, default=REPEAT, help='repeats per benchmark')
+    parser.add_argument('--out', default=None, help='JSON file to save results in')
+    parser.add_argument('--compare', default=None, help='JSON file of an earlier run to compare with')
+    parser.add_argument('--threshold', type=float, default=THRESHOLD,
+                        help='slow down that counts as a regression, e.g. 0.1 for 10%%')
+    args = parser.parse_args()
+    if args.list:
+        print('\n'.join(BENCHMARKS))
+        return
+    names = args.names or list(BENCHMARKS)
+    unknown = [name for name in names if name not in BENCHMARKS]
+    if unknown:
+        parser.error('unknown benchmarks: {}'.format(', '.join(unknown)))
+
+    screen = snackade.init()
+    # play() stays on the game loop: no frame waits and no pause after a game
+    snackade.clock = SteadyClock(snackade.TICK_RATE)
+    snackade.sleep = lambda seconds: None
+
+    results = {}
+    print('{:28s} {:>11s} {:>11s} {:>10s}'.format('benchmark', 'best', 'median', 'calls'))
+    for name in names:
+        results[name] = result = measure(name, args.repeat)
+        print('{:28s} {} {} {:10d}'.format(name, fmt(result['best']), fmt(result['median']), result['calls']))
+    snackade.sound_scheduler.stop()
+    pygame.quit()
+
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump({'time': strftime('%Y-%m-%d %H:%M:%S'), 'python': platform.python_version(),
+                       'pygame': pygame.version.ver, 'machine': platform.machine(),
+                       'repeat': args.repeat, 'results': results}, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)['results']
+        regressions = 0
+        print('\n{:28s} {:>11s} {:>11s} {:>8s}'.format('compared', 'before', 'after', 'change'))
+        for name, old, new, change in compare(results, baseline, args.threshold):
+            slower = change > args.threshold
+            regressions += slower
+            print('{:28s} {} {} {:+7.1%}{}'.format(name, fmt(old), fmt(new), change,
+                                                   '  REGRESSION' if slower else ''))
+        if regressions:
+            print('\n{} benchmarks slower by more than {:.0%}'.format(regressions, args.threshold))
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,910 @@
+"""
+  Snackade engine - the rules of Snackade with no pygame attached
+
+  The grid, players, snacks and win accounting live here so that matches can
+  be stepped one tick at a time without a display, mixer or clock. snackade.py
+  renders and feeds keyboard input on top of this module; tools can drive it
+  directly, e.g. to play computer players against each other:
+
+      gbox = GameBox()
+      match = Match(gbox, [ComputerPlayer(gbox, 1, 4, None),
+                           ComputerPlayer(gbox, GRID_XSIZE - 1, 4, None)])
+      match.reset()
+      match.run()
+
+MIT License - see snackade.py
+"""
+
+import math
+import random
+from collections import deque
+from enum import Enum
+
+# Game piece / Sprite values - each sprint adds its value to a grid location, so a
+# grid cell holds a count of border/player segments on it plus GVAL_SNACK if the
+# snack is there, e.g. GVAL_PLAYER + GVAL_SNACK is a player head on the snack
+GVAL_CLEAR = 0
+GVAL_BORDER = 1
+GVAL_PLAYER = 1
+GVAL_OCCUPIED = 1
+GVAL_SNACK = 10
+
+# Grid size - playing grid includes borders
+GRID_XSIZE = 23
+GRID_YSIZE = 15
+
+# The grid is stored flat, one byte per cell, column by column: cell = gx * GRID_YCELLS + gy
+GRID_YCELLS = GRID_YSIZE + 1
+GRID_CELLS = (GRID_XSIZE + 1) * GRID_YCELLS
+
+# Directions for sprites
+UP = (0, -1)
+DOWN = (0, 1)
+LEFT = (-1, 0)
+RIGHT = (1, 0)
+
+# Directions by code, for compact storage of moves
+DIRECTIONS = [UP, DOWN, LEFT, RIGHT]
+DIR_CODE = {d: code for code, d in enumerate(DIRECTIONS)}
+
+# Game moves per second when played in real time
+TICK_RATE = 5
+
+# Where each player starts a game and the direction it heads off in
+START_POSITIONS = [((1, 4), RIGHT), ((GRID_XSIZE - 1, 4), LEFT)]
+
+
+
+def start_positions(players):
+    """
+    Start positions for a number of players, the first two are START_POSITIONS
+    and any more are spread down both sides of the arena
+    :return:    list of ((gx, gy), direction)
+    """
+    if players <= len(START_POSITIONS):
+        return START_POSITIONS[:players]
+    (left, top), _ = START_POSITIONS[0]
+    (right, _), _ = START_POSITIONS[1]
+    per_side = (players + 1) // 2
+    rows = GRID_YSIZE - top
+    if per_side > rows:
+        raise ValueError('at most {} players fit in the arena'.format(2 * rows))
+    step = (rows - 1) // (per_side - 1)
+    positions = []
+    for gy in range(top, top + step * per_side, step):
+        positions += [((left, gy), RIGHT), ((right, gy), LEFT)]
+    return positions[:players]
+
+# maps from distance to simple direction, e.g. 10 becomes 1, -10 becomes -1
+dir_map = lambda x: 0 if x == 0 else abs(x) // x
+
+
+def grid_cell(gx, gy):
+    """
+    Index of a grid location in the flat grid
+    """
+    return gx * GRID_YCELLS + gy
+
+
+def _empty_grid():
+    grid = bytearray(GRID_CELLS)
+    for x in range(0,GRID_XSIZE+1):
+        grid[grid_cell(x, 0)] = GVAL_BORDER
+        grid[grid_cell(x, GRID_YSIZE)] = GVAL_BORDER
+    for y in range(0,GRID_YSIZE+1):
+        grid[grid_cell(0, y)] = GVAL_BORDER
+        grid[grid_cell(GRID_XSIZE, y)] = GVAL_BORDER
+    return bytes(grid)
+
+EMPTY_GRID = _empty_grid()
+
+# Cells a snack can be placed on - inside the ring next to the border
+SNACK_CELLS = [grid_cell(x, y) for x in range(2, GRID_XSIZE) for y in range(2, GRID_YSIZE)]
+
+# Zobrist keys for hashing game positions: a random 64 bit key per grid cell
+# value (folded into ZOBRIST_VALUES, a clear cell has key 0), per player slot
+# for its head cell and direction, and per snack value. The generator is
+# seeded so hashes agree between processes.
+ZOBRIST_VALUES = 32    # a power of 2, grid_upval inlines cell_key() for 32
+ZOBRIST_SLOTS = 2 * GRID_YSIZE
+_zobrist = random.Random(0x5AC4ADE)
+CELL_KEYS = [_zobrist.getrandbits(64) if value else 0
+             for cell in range(GRID_CELLS) for value in range(ZOBRIST_VALUES)]
+HEAD_KEYS = [[_zobrist.getrandbits(64) for cell in range(GRID_CELLS)] for slot in range(ZOBRIST_SLOTS)]
+# by direction, (0, 0) for a player that has not set off
+DIR_KEYS = [{d: _zobrist.getrandbits(64) for d in DIRECTIONS + [(0, 0)]} for slot in range(ZOBRIST_SLOTS)]
+SNACK_KEYS = [_zobrist.getrandbits(64) for value in range(16)]
+
+
+def cell_key(cell, value):
+    """
+    Zobrist key of a grid cell holding a value
+    """
+    return CELL_KEYS[cell * ZOBRIST_VALUES + (value & (ZOBRIST_VALUES - 1))]
+
+
+def grid_hash(grid):
+    """
+    Zobrist hash of grid values from scratch, GameBox.hash keeps it up to date
+    """
+    h = 0
+    for cell, value in enumerate(grid):
+        if value:
+            h ^= cell_key(cell, value)
+    return h
+
+
+# Set up grid to check for collisions
+def init_grid(grid):
+
+    if grid == None:
+        grid = bytearray(EMPTY_GRID)
+    else:
+        grid[:] = EMPTY_GRID
+
+    return grid
+
+
+EMPTY_HASH = grid_hash(EMPTY_GRID)
+
+
+# Class to hold the state of the playing grid
+class GameBox:
+    # Board size and Zobrist key tables, ChunkedGameBox has its own
+    xsize = GRID_XSIZE
+    ysize = GRID_YSIZE
+    ycells = GRID_YCELLS
+    head_keys = HEAD_KEYS
+    dir_keys = DIR_KEYS
+
+    def __init__(self):
+        self.grid = init_grid(None)
+        # Zobrist hash of the position: the grid values, which places the
+        # snack, XORed with the players' head keys and the snack value's key
+        self.hash = EMPTY_HASH
+        self.snack_location = None
+        self.snack_value = 0
+        # free snack cells in any order, and each cell's index in it or -1
+        self.snack_area = bytearray(GRID_CELLS)
+        for cell in SNACK_CELLS:
+            self.snack_area[cell] = 1
+        self._reset_free()
+        # list to collect the cells grid_setval/grid_upval change, e.g. for
+        # streaming them to spectators, None when nobody is watching
+        self.journal = None
+
+    def _reset_free(self):
+        self.free = list(SNACK_CELLS)
+        self.free_pos = [-1] * GRID_CELLS
+        for i, cell in enumerate(SNACK_CELLS):
+            self.free_pos[cell] = i
+
+    def _set_free(self, cell, free):
+        if free:
+            self.free_pos[cell] = len(self.free)
+            self.free.append(cell)
+        else:
+            # swap the last free cell into this one's slot
+            i = self.free_pos[cell]
+            last = self.free.pop()
+            if last != cell:
+                self.free[i] = last
+                self.free_pos[last] = i
+            self.free_pos[cell] = -1
+
+    def grid_reset(self):
+        self.grid = init_grid(self.grid)
+        self.hash = EMPTY_HASH
+        self.snack_location = None
+        self._reset_free()
+
+    def grid_load(self, grid):
+        """
+        Copy in grid values, e.g. from another game box, with no snack on it
+        :param grid:    flat grid bytes
+        """
+        self.grid[:] = grid
+        self.hash = grid_hash(grid)
+        self.snack_location = None
+        self.free = [cell for cell in SNACK_CELLS if grid[cell] == GVAL_CLEAR]
+        self.free_pos = [-1] * GRID_CELLS
+        for i, cell in enumerate(self.free):
+            self.free_pos[cell] = i
+
+    def snapshot(self):
+        """
+        Capture the grid, snack, free cell index and hash
+        :return:    state for restore()
+        """
+        return (bytes(self.grid), self.snack_location, self.snack_value, self.free[:], self.free_pos[:],
+                self.hash)
+
+    def restore(self, state):
+        """
+        Put back a state from snapshot(), copying into the existing buffers
+        """
+        grid, self.snack_location, self.snack_value, free, free_pos, self.hash = state
+        self.grid[:] = grid
+        self.free[:] = free
+        self.free_pos[:] = free_pos
+
+    def grid_setval(self, gx, gy, value):
+        cell = gx * GRID_YCELLS + gy
+        old = self.grid[cell]
+        was_clear = old == GVAL_CLEAR
+        self.grid[cell] = value
+        self.hash ^= cell_key(cell, old) ^ cell_key(cell, value)
+        if self.journal is not None:
+            self.journal.append(cell)
+        if self.snack_area[cell] and was_clear != (value == GVAL_CLEAR):
+            self._set_free(cell, not was_clear)
+
+    def grid_upval(self, gx, gy, value):
+        cell = gx * GRID_YCELLS + gy
+        old = self.grid[cell]
+        new = old + value
+        self.grid[cell] = new
+        base = cell << 5
+        self.hash ^= CELL_KEYS[base | (old & 31)] ^ CELL_KEYS[base | (new & 31)]
+        if self.journal is not None:
+            self.journal.append(cell)
+        if self.snack_area[cell] and (old == GVAL_CLEAR or new == GVAL_CLEAR):
+            self._set_free(cell, old != GVAL_CLEAR)
+        if value == GVAL_SNACK:
+            self.snack_location = (gx, gy)
+        elif value == -GVAL_SNACK:
+            self.snack_location = None
+
+    def grid_val(self, gx, gy):
+        return self.grid[gx * GRID_YCELLS + gy]
+
+    def free_count(self):
+        """
+        Number of clear cells a snack could be placed on
+        """
+        return len(self.free)
+
+    def random_free_cell(self, rng=random):
+        """
+        Pick a clear snack cell uniformly at random
+        :param rng:     random generator to pick with
+        :return:        gx, gy or None if the board is full
+        """
+        if not self.free:
+            return None
+        return divmod(self.free[rng.randint(0, len(self.free) - 1)], GRID_YCELLS)
+
+    def start_positions(self, players):
+        """
+        Where players start on this board, see start_positions()
+        """
+        return start_positions(players)
+
+
+# Large boards are stored in square chunks of 2 ** CHUNK_BITS cells a side
+CHUNK_BITS = 5
+CHUNK_SIZE = 1 << CHUNK_BITS
+CHUNK_MASK = CHUNK_SIZE - 1
+# Random picks tried before a snack spot is found by scanning the board
+SNACK_TRIES = 64
+
+MASK64 = (1 << 64) - 1
+
+
+def mixed_key(n):
+    """
+    A 64 bit Zobrist key made from a number with the splitmix64 mixer, for
+    boards too big to store a key per cell
+    """
+    n = (n + 0x9E3779B97F4A7C15) & MASK64
+    n = ((n ^ (n >> 30)) * 0xBF58476D1CE4E5B9) & MASK64
+    n = ((n ^ (n >> 27)) * 0x94D049BB133111EB) & MASK64
+    return n ^ (n >> 31)
+
+
+class MixedKeys:
+    """
+    Indexes like a key table, making each key with mixed_key()
+    """
+    def __init__(self, salt):
+        self.salt = salt
+
+    def __getitem__(self, index):
+        return mixed_key(self.salt + index)
+
+
+class SlotKeys(dict):
+    """
+    Keys per player slot made on first use, so any number of players fit
+    """
+    def __init__(self, make):
+        super().__init__()
+        self.make = make
+
+    def __missing__(self, slot):
+        keys = self[slot] = self.make(slot)
+        return keys
+
+
+# Salts keeping the chunked board's cell, head and direction keys apart
+CELL_SALT = 1 << 40
+HEAD_SALT = 2 << 40
+DIR_SALT = 3 << 40
+
+
+class ChunkedGameBox(GameBox):
+    """
+    Game box for a board of any size, e.g. 1000 x 1000 for arenas of many
+    players. The grid is kept in chunks that are only allocated once
+    something is put on them, so memory follows the cells the players have
+    touched rather than the board size. Free snack cells are counted rather
+    than indexed, and picked at random until a clear one turns up.
+    Cells are still numbered gx * ycells + gy, for trails and journals.
+    """
+    head_keys = SlotKeys(lambda slot: MixedKeys(HEAD_SALT + (slot << 32)))
+    dir_keys = SlotKeys(lambda slot: {d: mixed_key(DIR_SALT + (slot << 8) + code)
+                                      for code, d in enumerate(DIRECTIONS + [(0, 0)])})
+
+    def __init__(self, xsize, ysize):
+        """
+        Initialize an empty board
+        :param xsize:   grid x of the right border
+        :param ysize:   grid y of the bottom border
+        """
+        if xsize < 4 or ysize < 4:
+            raise ValueError('board must be at least 4 x 4')
+        self.xsize = xsize
+        self.ysize = ysize
+        self.ycells = ysize + 1
+        self.chunk_rows = (ysize >> CHUNK_BITS) + 1
+        # snack cells, the same ring inside the border as the classic board
+        self.snack_cells = (xsize - 2) * (ysize - 2)
+        self.snack_value = 0
+        self.journal = None
+
+        # the border goes in once, resets copy its chunks back
+        self.chunks = {}
+        self.hash = 0
+        for x in range(xsize + 1):
+            for y in (0, ysize):
+                self.grid_setval(x, y, GVAL_BORDER)
+        for y in range(1, ysize):
+            for x in (0, xsize):
+                self.grid_setval(x, y, GVAL_BORDER)
+        self.border_chunks = {key: bytes(chunk) for key, chunk in self.chunks.items()}
+        self.empty_hash = self.hash
+        self.grid_reset()
+
+    def grid_reset(self):
+        self.chunks = {key: bytearray(chunk) for key, chunk in self.border_chunks.items()}
+        self.hash = self.empty_hash
+        self.snack_location = None
+        self.filled = 0
+
+    def grid_load(self, grid):
+        """
+        Copy in grid values, e.g. from another game box, with no snack on it
+        :param grid:    flat grid bytes, gx * ycells + gy
+        """
+        if len(grid) != (self.xsize + 1) * self.ycells:
+            raise ValueError('grid is not {} x {}'.format(self.xsize + 1, self.ycells))
+        self.chunks = {}
+        self.hash = 0
+        self.snack_location = None
+        self.filled = 0
+        journal, self.journal = self.journal, None
+        ycells = self.ycells
+        # only the cells with something on them, chunks stay unallocated elsewhere
+        for cell, value in enumerate(grid):
+            if value:
+                self.grid_setval(cell // ycells, cell % ycells, value)
+        self.journal = journal
+
+    def snapshot(self):
+        """
+        Capture the touched chunks, snack, free count and hash
+        :return:    state for restore()
+        """
+        return ({key: bytes(chunk) for key, chunk in self.chunks.items()},
+                self.snack_location, self.snack_value, self.filled, self.hash)
+
+    def restore(self, state):
+        """
+        Put back a state from snapshot()
+        """
+        chunks, self.snack_location, self.snack_value, self.filled, self.hash = state
+        self.chunks = {key: bytearray(chunk) for key, chunk in chunks.items()}
+
+    def _chunk(self, gx, gy):
+        # the chunk holding a cell, allocated on first use
+        key = (gx >> CHUNK_BITS) * self.chunk_rows + (gy >> CHUNK_BITS)
+        chunk = self.chunks.get(key)
+        if chunk is None:
+            chunk = self.chunks[key] = bytearray(CHUNK_SIZE * CHUNK_SIZE)
+        return chunk
+
+    def _set(self, gx, gy, old, new):
+        cell = gx * self.ycells + gy
+        self.hash ^= ((mixed_key(CELL_SALT + (cell << 5 | old & 31)) if old else 0) ^
+                      (mixed_key(CELL_SALT + (cell << 5 | new & 31)) if new else 0))
+        if self.journal is not None:
+            self.journal.append(cell)
+        if (old == GVAL_CLEAR) != (new == GVAL_CLEAR) and 2 <= gx < self.xsize and 2 <= gy < self.ysize:
+            self.filled += 1 if old == GVAL_CLEAR else -1
+
+    def grid_setval(self, gx, gy, value):
+        chunk = self._chunk(gx, gy)
+        i = (gx & CHUNK_MASK) << CHUNK_BITS | (gy & CHUNK_MASK)
+        old = chunk[i]
+        chunk[i] = value
+        self._set(gx, gy, old, value)
+
+    def grid_upval(self, gx, gy, value):
+        chunk = self._chunk(gx, gy)
+        i = (gx & CHUNK_MASK) << CHUNK_BITS | (gy & CHUNK_MASK)
+        old = chunk[i]
+        new = old + value
+        chunk[i] = new
+        self._set(gx, gy, old, new)
+        if value == GVAL_SNACK:
+            self.snack_location = (gx, gy)
+        elif value == -GVAL_SNACK:
+            self.snack_location = None
+
+    def grid_val(self, gx, gy):
+        chunk = self.chunks.get((gx >> CHUNK_BITS) * self.chunk_rows + (gy >> CHUNK_BITS))
+        return chunk[(gx & CHUNK_MASK) << CHUNK_BITS | (gy & CHUNK_MASK)] if chunk else GVAL_CLEAR
+
+    def free_count(self):
+        return self.snack_cells - self.filled
+
+    def random_free_cell(self, rng=random):
+        """
+        Pick a clear snack cell at random
+        :param rng:     random generator to pick with
+        :return:        gx, gy or None if the board is full
+        """
+        if not self.free_count():
+            return None
+        for i in range(SNACK_TRIES):
+            gx, gy = rng.randint(2, self.xsize - 1), rng.randint(2, self.ysize - 1)
+            if self.grid_val(gx, gy) == GVAL_CLEAR:
+                return gx, gy
+        # a crowded board, pick from the clear cells left
+        return rng.choice([(gx, gy) for gx in range(2, self.xsize) for gy in range(2, self.ysize)
+                           if self.grid_val(gx, gy) == GVAL_CLEAR])
+
+    def start_positions(self, players):
+        """
+        Starts spread evenly over the board in rows, facing right and left
+        in turn so neighbours head towards each other
+        :return:    list of ((gx, gy), direction)
+        """
+        columns = math.ceil(math.sqrt(players))
+        rows = math.ceil(players / columns)
+        positions = []
+        for i in range(players):
+            row, column = divmod(i, columns)
+            gx = (column + 1) * self.xsize // (columns + 1)
+            gy = (row + 1) * self.ysize // (rows + 1)
+            positions.append(((gx, gy), RIGHT if i % 2 == 0 else LEFT))
+        return positions
+
+    def memory(self):
+        """
+        Bytes of grid allocated
+        """
+        return len(self.chunks) * CHUNK_SIZE * CHUNK_SIZE
+
+
+class GridSprite:
+
+    def __init__(self, gbox, gx, gy, colour, sprite_value):
+        self.gbox = gbox
+        self.colour = colour
+        self.sprite_value = sprite_value
+
+    def place(self, gx, gy):
+        """
+        Place sprite on grid by setting its value
+        """
+        self.gx = gx
+        self.gy = gy
+        self.gbox.grid_upval(gx, gy, self.sprite_value)
+
+    def remove(self, gx, gy):
+        """
+        Remove sprite from grid, subtract value from grid location
+        """
+        self.gbox.grid_upval(gx, gy, -self.sprite_value)
+
+    def location(self):
+        return self.gx, self.gy
+
+
+class Snack(GridSprite):
+    def __init__(self, gbox, location=None, value=None, rng=random):
+        """
+        Put a snack on the grid
+        :param gbox:        game box holding the grid
+        :param location:    gx, gy for the snack, default a random free cell
+        :param value:       snack value, default random 1 to 3
+        :param rng:         random generator for the location and value
+        """
+        # find an empty spot on the grid for the snack
+        if location is None:
+            location = gbox.random_free_cell(rng)
+            if location is None:
+                raise ValueError('board is full, no free cell for a snack')
+        gx, gy = location
+
+        # value of the snack is both points and segments to grow, 1 to 3
+        self.value = rng.randint(1,3) if value is None else value
+
+        super().__init__(gbox, gx, gy, None, GVAL_SNACK)
+        self.place(gx, gy)
+        gbox.snack_value = self.value
+        gbox.hash ^= SNACK_KEYS[self.value & 15]
+
+    def clear(self):
+        """
+        Remove snack value from grid
+        """
+        self.remove(self.gx, self.gy)
+        self.gbox.hash ^= SNACK_KEYS[self.value & 15]
+
+
+class Player(GridSprite):
+
+    # Direction changes that can wait for coming ticks
+    MAX_TURNS = 3
+
+    class Status(Enum):
+        CLEAR = 0
+        CHOMP = 1
+        COLLISION = 2
+
+    def __init__(self, gbox, gx, gy, colour, move_chars):
+        """
+        Initialize player
+        :param gbox:    game box holding the grid
+        :param gx:      grid x to start player
+        :param gy:      grid y to start player
+        :param colour:  colour of player, only used by renderers
+        :param move_chars:   list with up,down,left,right characters for control
+        """
+        super().__init__(gbox, gx, gy, colour, GVAL_PLAYER)
+        self.wins = 0
+        self.points = 0
+        self.opponents = []
+        self.dx, self.dy = 0, 0
+        # index into the Zobrist keys, set by Match, and the head and
+        # direction keys XORed into gbox.hash
+        self.slot = 0
+        self.head_key = 0
+        self.dir_key = 0
+        self.set_head(gx, gy)
+        self.move_key = {}
+        # set up, down, left, right vectors for keys if defined
+        if len(move_chars) == 4:
+            self.move_key[ord(move_chars[0])] = UP
+            self.move_key[ord(move_chars[1])] = DOWN
+            self.move_key[ord(move_chars[2])] = LEFT
+            self.move_key[ord(move_chars[3])] = RIGHT
+        else:
+            self.move_key = []
+
+        self.status = self.Status.CLEAR
+
+    def set_head(self, gx, gy):
+        self.place(gx, gy)
+        self.turns = deque()
+        # trail holds the grid cell of each segment, oldest on the left
+        self.trail = deque()
+        self.grow(2)
+        self.trail.append(self.gx * self.gbox.ycells + self.gy)
+        self.tail = (self.gx, self.gy)
+        # a new head, on a fresh grid or one without this player on it yet
+        self.rehash_head(cleared=True)
+
+    def rehash_head(self, cleared=False):
+        """
+        Update the game box hash for this player's head cell and direction,
+        move() and set_direction() keep it up to date themselves
+        :param cleared: the hash was rebuilt without this player's keys,
+                        e.g. by GameBox.grid_load
+        """
+        if cleared:
+            self.head_key = self.dir_key = 0
+        gbox = self.gbox
+        head_key = gbox.head_keys[self.slot][self.gx * gbox.ycells + self.gy]
+        dir_key = gbox.dir_keys[self.slot][(self.dx, self.dy)]
+        self.gbox.hash ^= self.head_key ^ head_key ^ self.dir_key ^ dir_key
+        self.head_key, self.dir_key = head_key, dir_key
+
+    def snapshot(self):
+        """
+        Capture the player's position, trail, queued turns and score
+        :return:    state for restore()
+        """
+        return (self.gx, self.gy, self.dx, self.dy, tuple(self.trail), tuple(self.turns), self.tail,
+                self.points, self.wins, self.status, self.head_key, self.dir_key)
+
+    def restore(self, state):
+        """
+        Put back a state from snapshot()
+        """
+        (self.gx, self.gy, self.dx, self.dy, trail, turns, self.tail,
+         self.points, self.wins, self.status, self.head_key, self.dir_key) = state
+        self.trail = deque(trail)
+        self.turns = deque(turns)
+
+    def set_direction(self, dx, dy):
+        """
+        Sets player's direction
+        :param dx:  dx part of direction vector
+        :param dy:  dy part of direction vector
+        :return:
+        """
+        self.dx, self.dy = dx, dy
+        key = self.gbox.dir_keys[self.slot][(dx, dy)]
+        self.gbox.hash ^= self.dir_key ^ key
+        self.dir_key = key
+
+    def queue_direction(self, dx, dy):
+        """
+        Queue a direction change for the next tick without one, so several
+        quick turns between ticks are each made rather than the last winning
+        :param dx:  dx part of direction vector
+        :param dy:  dy part of direction vector
+        """
+        last = self.turns[-1] if self.turns else (self.dx, self.dy)
+        if (dx, dy) != last and len(self.turns) < self.MAX_TURNS:
+            self.turns.append((dx, dy))
+
+    def grow(self, segments, points=0):
+        """
+        Grow the player
+        :param segments:    number of segments to grow
+        :param points:      points to add to score, default 0
+        :return:            None
+        """
+        head = self.gx * self.gbox.ycells + self.gy
+        for i in range(0,segments):
+            self.trail.append(head)
+            self.place(self.gx, self.gy)
+        self.points += points
+
+    def move(self):
+        # return if no move
+        if not (self.dx or self.dy):
+            return
+
+        gbox = self.gbox
+        self.place(self.gx + self.dx, self.gy + self.dy)
+        head = self.gx * gbox.ycells + self.gy
+        self.trail.append(head)
+        self.tail = divmod(self.trail.popleft(), gbox.ycells)
+        self.remove(self.tail[0], self.tail[1])
+        key = gbox.head_keys[self.slot][head]
+        gbox.hash ^= self.head_key ^ key
+        self.head_key = key
+
+    def update_status(self):
+        # check for collisions and chomping - count what else is on the head's
+        # cell with the snack taken out, so any number of players can pile up
+        value = self.gbox.grid_val(self.gx, self.gy)
+        on_snack = self.gbox.snack_location == (self.gx, self.gy)
+        if on_snack:
+            value -= GVAL_SNACK
+        if value > GVAL_PLAYER:
+            self.status = self.Status.COLLISION
+        elif on_snack:
+            self.status = self.Status.CHOMP
+        else:
+            self.status = self.Status.CLEAR
+
+
+class ComputerPlayer(Player):
+
+    RIGHT_TURN = {UP:RIGHT, RIGHT:DOWN, DOWN:LEFT, LEFT:UP}
+    LEFT_TURN  = {UP:LEFT, LEFT:DOWN, DOWN:RIGHT, RIGHT:UP}
+
+    # Dictionary of turns to make when a snack appears. Given the direction of the
+    # snack and the current direction of the computer player, give the direction to
+    # head to go towards the snack
+    #
+    #  Direction of snack, current direction -> direction to head
+    #
+    SNACK_TURN = {
+        (0, -1):    { UP:UP,    DOWN:LEFT,  LEFT:UP,    RIGHT:UP},
+        (1, -1):    { UP:UP,    DOWN:RIGHT, LEFT:UP,    RIGHT:RIGHT},
+        (1,  0):    { UP:RIGHT, DOWN:RIGHT, LEFT:UP,    RIGHT:RIGHT},
+        (1,  1):    { UP:RIGHT, DOWN:RIGHT, LEFT:DOWN,  RIGHT:RIGHT},
+        (0,  1):    { UP:RIGHT, DOWN:DOWN,  LEFT:DOWN,  RIGHT:DOWN},
+        (-1, 1):    { UP:LEFT,  DOWN:DOWN,  LEFT:LEFT,  RIGHT:DOWN},
+        (-1, 0):    { UP:LEFT,  DOWN:LEFT,  LEFT:LEFT,  RIGHT:DOWN},
+        (-1, -1):   { UP:UP,    DOWN:LEFT,  LEFT:LEFT,  RIGHT:UP}
+    }
+
+    # Set the computer player up just like regular player, except no key controls
+    def __init__(self, gbox, gx, gy, colour):
+        super().__init__(gbox, gx, gy, colour, [])
+
+    def choose(self):
+        """
+        Pick the direction to move this tick
+        :return:    dx, dy
+        """
+        # calculate turn options
+        turn_options = [(self.dx, self.dy),
+                        self.RIGHT_TURN[(self.dx, self.dy)],
+                        self.LEFT_TURN[(self.dx, self.dy)]]
+
+        # if there is a snack then head towards it, otherwise default same direction
+        if self.gbox.snack_location:
+            snack_x, snack_y = self.gbox.snack_location
+            sx, sy = dir_map(snack_x - self.gx), dir_map(snack_y - self.gy)
+            dx, dy = self.SNACK_TURN[(sx, sy)][(self.dx, self.dy)]
+        else:
+            dx,dy = self.dx, self.dy
+
+        # if about to crash then turn if it helps
+        gval_infront = self.gbox.grid_val(self.gx + dx, self.gy + dy)
+        if gval_infront and gval_infront < GVAL_SNACK:
+            for dx, dy in turn_options:
+                if self.gbox.grid_val(self.gx + dx, self.gy + dy) == GVAL_CLEAR:
+                    break
+
+        return dx, dy
+
+    def move(self):
+        self.set_direction(*self.choose())
+        super().move()
+
+
+class TickResult:
+    """
+    What happened during one Match.tick, for renderers and sound to act on
+    """
+    def __init__(self):
+        self.snack_placed = None    # new Snack put on the grid this tick
+        self.snack_cleared = None   # Snack that expired or was eaten this tick
+        self.chomped = []           # players that ate the snack
+        self.crashed = []           # players that collided
+        self.game_over = False      # at most one player is left
+
+
+class Match:
+    """
+    Steps a game between players one tick at a time - one tick is one move.
+    Players that crash are out and their bodies stay where they are, the game
+    is over once at most one player is left.
+    """
+    # 1 in SNACK_CHANCE ticks a snack is added, or removed 1 in SNACK_EXPIRE of those
+    SNACK_CHANCE = 15
+    SNACK_EXPIRE = 5
+
+    def __init__(self, gbox, players):
+        """
+        Initialize match
+        :param gbox:    game box holding the grid
+        :param players: players in start_positions() order
+        """
+        self.gbox = gbox
+        self.players = players
+        self.alive = list(players)
+        self.snack = None
+        self.ticks = 0
+        # every game draws its snacks from its own seeded generator
+        self.rng = random.Random()
+        self.seed = None
+        for slot, p in enumerate(players):
+            p.opponents = [o for o in players if o is not p]
+            p.slot = slot
+            p.rehash_head()
+
+    def reset(self, seed=None):
+        """
+        Clear the grid and put players back at their start positions
+        :param seed:    seed for the game's random events, default a new random seed
+        """
+        self.seed = random.getrandbits(63) if seed is None else seed
+        self.rng.seed(self.seed)
+        self.gbox.grid_reset()
+        self.snack = None
+        self.ticks = 0
+        self.alive = list(self.players)
+        for p, ((gx, gy), (dx, dy)) in zip(self.players, self.gbox.start_positions(len(self.players))):
+            p.set_head(gx, gy)
+            p.set_direction(dx, dy)
+            p.status = Player.Status.CLEAR
+            p.opponents = [o for o in self.players if o is not p]
+
+    def snapshot(self):
+        """
+        Capture everything a tick can change, so the game can be rewound and
+        played forward again, e.g. to roll back a predicted network input.
+        The grid and trails are flat buffers so this is a few copies of a
+        few hundred bytes rather than a deep copy.
+        :return:    state for restore()
+        """
+        return (self.ticks, self.snack, self.rng.getstate(), self.gbox.snapshot(),
+                [p.snapshot() for p in self.players], tuple(self.alive))
+
+    def restore(self, state):
+        """
+        Rewind to a state from snapshot(), which can be restored any number of times
+        """
+        self.ticks, self.snack, rng, gbox, players, alive = state
+        self.rng.setstate(rng)
+        self.gbox.restore(gbox)
+        for p, player in zip(self.players, players):
+            p.restore(player)
+        if len(alive) != len(self.alive):
+            self.alive = list(alive)
+            for p in self.alive:
+                p.opponents = [o for o in self.alive if o is not p]
+
+    def tick(self):
+        """
+        Advance the game one move
+        :return:    TickResult describing the changes
+        """
+        result = TickResult()
+        self.ticks += 1
+
+        # random snack event to create or remove snack
+        if self.rng.randint(1, self.SNACK_CHANCE) == self.SNACK_CHANCE:
+            if self.snack:
+                if self.rng.randint(1, self.SNACK_EXPIRE) == self.SNACK_EXPIRE:
+                    self.snack.clear()
+                    result.snack_cleared = self.snack
+                    self.snack = None
+            elif self.gbox.free_count():
+                self.snack = Snack(self.gbox, rng=self.rng)
+                result.snack_placed = self.snack
+
+        # first move everyone to new positions, taking one queued turn each
+        for p in self.alive:
+            if p.turns:
+                p.set_direction(*p.turns.popleft())
+            p.move()
+
+        # then one pass over the heads settles crashes, head on ones included,
+        # since everyone has moved - a head sharing its cell with anything
+        # else crashes, so only a lone head on the snack can chomp it
+        for p in self.alive:
+            p.update_status()
+            if p.status == Player.Status.COLLISION:
+                result.crashed.append(p)
+            elif p.status == Player.Status.CHOMP:
+                p.grow(self.snack.value, self.snack.value)
+                self.snack.clear()
+                result.snack_cleared = self.snack
+                result.chomped.append(p)
+                self.snack = None
+
+        if result.crashed:
+            self.alive = [p for p in self.alive if p.status != Player.Status.COLLISION]
+            if len(self.alive) <= 1:
+                # anyone left standing wins
+                result.game_over = True
+                for p in self.alive:
+                    p.wins += 1
+            else:
+                for p in self.alive:
+                    p.opponents = [o for o in p.opponents if o.status != Player.Status.COLLISION]
+
+        return result
+
+    def run(self, max_ticks=None):
+        """
+        Tick until a player crashes
+        :param max_ticks:   stop after this many ticks, None to play it out
+        :return:            last TickResult
+        """
+        while True:
+            result = self.tick()
+            if result.game_over or (max_ticks and self.ticks >= max_ticks):
+                return result
@@ -0,0 +1,162 @@
+"""
+  Snackade environments - the game as reinforcement learning environments
+
+  SnackadeEnv plays one engine.Match, VectorEnv steps a whole batch.BatchMatch
+  of boards per call. Both follow the Gym reset/step conventions without
+  needing gym installed: actions are direction codes (indexes into
+  engine.DIRECTIONS) for the first player, the second player is a built in
+  ComputerPlayer, and
+
+      obs, info = env.reset(seed)
+      obs, reward, terminated, truncated, info = env.step(action)
+
+  Observations are NumPy views of the game's own arrays, updated in place by
+  every step rather than copied, so copy them to keep one. The reward is the
+  points eaten that tick, plus 1 for winning or -1 for losing at the end.
+
+      env = VectorEnv(4096, seed=1)
+      obs, info = env.reset()
+      for i in range(1000):
+          obs, reward, terminated, truncated, info = env.step(policy(obs))
+
+MIT License - see snackade.py
+"""
+
+import numpy as np
+
+from engine import (DIRECTIONS, DIR_CODE, GRID_XSIZE, GRID_YCELLS, START_POSITIONS,
+                    ComputerPlayer, GameBox, Match, Player)
+from batch import BatchMatch
+
+# Ticks before a game is cut off and counts as truncated
+MAX_TICKS = 1000
+
+
+class SnackadeEnv:
+    """
+    One game against a ComputerPlayer, stepped one tick per action
+    """
+    def __init__(self, opponent=ComputerPlayer, max_ticks=MAX_TICKS):
+        """
+        Initialize environment
+        :param opponent:    opponent class, made like ComputerPlayer(gbox, gx, gy, colour)
+        :param max_ticks:   ticks before a game is truncated
+        """
+        self.max_ticks = max_ticks
+        self.gbox = GameBox()
+        (ax, ay), _ = START_POSITIONS[0]
+        (ox, oy), _ = START_POSITIONS[1]
+        self.agent = Player(self.gbox, ax, ay, None, [])
+        self.opponent = opponent(self.gbox, ox, oy, None)
+        self.match = Match(self.gbox, [self.agent, self.opponent])
+        # grid values by [gx, gy], sharing the game box's grid buffer
+        self.grid = np.frombuffer(self.gbox.grid, dtype=np.uint8).reshape(GRID_XSIZE + 1, GRID_YCELLS)
+        # gx, gy and direction code of each player's head
+        self.players = np.zeros((2, 3), dtype=np.int16)
+        self.obs = {'grid': self.grid, 'players': self.players}
+
+    def _observe(self):
+        for row, p in zip(self.players, self.match.players):
+            row[:] = p.gx, p.gy, DIR_CODE[(p.dx, p.dy)]
+        return self.obs
+
+    def reset(self, seed=None):
+        """
+        Start a new game
+        :param seed:    game seed, default a random one
+        :return:        observation, info
+        """
+        self.match.reset(seed)
+        return self._observe(), {'seed': self.match.seed}
+
+    def step(self, action):
+        """
+        Move the agent in a direction and play one tick
+        :param action:  direction code, index into DIRECTIONS
+        :return:        observation, reward, terminated, truncated, info
+        """
+        points = self.agent.points
+        self.agent.set_direction(*DIRECTIONS[action])
+        result = self.match.tick()
+        reward = float(self.agent.points - points)
+        # a draw when both crash
+        if result.game_over and self.match.alive:
+            reward += 1.0 if self.agent in self.match.alive else -1.0
+        truncated = not result.game_over and self.match.ticks >= self.max_ticks
+        return self._observe(), reward, result.game_over, truncated, {'ticks': self.match.ticks}
+
+
+class VectorEnv:
+    """
+    Many games against ComputerPlayer stepped together on a BatchMatch.
+    Finished boards start a new game straight away, their final step is still
+    reported as terminated or truncated.
+    """
+    def __init__(self, n, seed=None, max_ticks=MAX_TICKS):
+        """
+        Initialize environments
+        :param n:           number of boards
+        :param seed:        seed for the batch random generator
+        :param max_ticks:   ticks before a game is truncated
+        """
+        self.n = n
+        self.max_ticks = max_ticks
+        self.batch = BatchMatch(n, computer=(False, True), seed=seed, auto_reset=False)
+        # the batch's own arrays: grid values by [board, gx, gy], head grid
+        # cells (gx * GRID_YCELLS + gy) and direction codes by [board, player]
+        self.obs = {'grid': self.batch.grid, 'head': self.batch.head, 'direction': self.batch.direction}
+        self._points = np.zeros(n, dtype=np.int32)
+
+    def reset(self, seed=None):
+        """
+        Start a new game on every board
+        :param seed:    reseed the batch random generator
+        :return:        observations, info
+        """
+        if seed is not None:
+            self.batch.rng = np.random.default_rng(seed)
+        self.batch.reset()
+        self._points[:] = 0
+        return self.obs, {}
+
+    def step(self, actions):
+        """
+        Move the agent on every board and play one tick
+        :param actions: direction code per board
+        :return:        observations, rewards, terminated, truncated, info
+        """
+        batch = self.batch
+        batch.set_directions(0, actions)
+        terminated = batch.tick()
+        points = batch.points[:, 0]
+        reward = (points - self._points).astype(np.float32)
+        crashed = batch.crashed
+        reward[terminated & crashed[:, 1] & ~crashed[:, 0]] += 1.0
+        reward[terminated & crashed[:, 0] & ~crashed[:, 1]] -= 1.0
+        truncated = ~terminated & (batch.ticks >= self.max_ticks)
+
+        done = np.nonzero(terminated | truncated)[0]
+        if len(done):
+            batch.reset(done)
+        self._points[:] = batch.points[:, 0]
+        return self.obs, reward, terminated, truncated, {}
+
+
+if __name__ == '__main__':
+    from time import perf_counter
+    env = VectorEnv(4096, seed=1)
+    obs, info = env.reset()
+    rng = np.random.default_rng(2)
+    steps = 500
+    total = 0.0
+    games = 0
+    start = perf_counter()
+    for i in range(steps):
+        # keep going, now and then turning at random
+        actions = np.where(rng.random(env.n) < 0.1, rng.integers(0, 4, env.n), obs['direction'][:, 0])
+        obs, reward, terminated, truncated, info = env.step(actions)
+        total += reward.sum()
+        games += terminated.sum() + truncated.sum()
+    elapsed = perf_counter() - start
+    print('{:.0f} steps/s, {} games, mean reward per game {:.2f}'.format(
+        steps * env.n / elapsed, games, total / max(games, 1)))
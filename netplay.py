@@ -0,0 +1,390 @@
+#!/usr/bin/python3
+"""
+  Snackade network play - head to head over asyncio in lockstep
+
+  The server seeds each game and advances it at the game tick rate. Clients
+  only send direction changes, tagged with the tick they should apply on a
+  few ticks ahead to hide network delay. Every tick the server broadcasts the
+  directions it applied, and each client steps its own seeded copy of the
+  match with them, so all copies stay identical.
+
+      python netplay.py server --port 7777
+      python netplay.py bot --port 7777       # a ComputerPlayer over the network
+      SNACKADE_SERVER=localhost:7777 python snackade.py
+
+  Messages are fixed size structs, the first byte giving the type:
+
+      S  server -> client   start: player index, players, seed, input delay
+      D  client -> server   direction change: tick, direction code
+      T  server -> client   tick: tick number, direction codes 2 bits per player
+      P  both ways          ping with the client's send time, echoed back
+
+MIT License - see snackade.py
+"""
+
+import argparse
+import asyncio
+import queue
+import struct
+import threading
+
+from engine import DIRECTIONS, DIR_CODE, START_POSITIONS, start_positions, TICK_RATE, ComputerPlayer, GameBox, Match, Player
+
+# Ticks ahead a direction change is applied on
+INPUT_DELAY = 2
+# Seconds between games and between pings
+RESTART_DELAY = 2.0
+PING_INTERVAL = 1.0
+
+START = struct.Struct('<cBBQB')
+DIRECTION = struct.Struct('<cIB')
+TICK = struct.Struct('<cIB')
+PING = struct.Struct('<cd')
+MESSAGES = {b'S': START, b'D': DIRECTION, b'T': TICK, b'P': PING}
+
+
+async def read_message(reader):
+    """
+    Read one message
+    :return:    unpacked message tuple, type first
+    """
+    kind = await reader.readexactly(1)
+    message = MESSAGES[kind]
+    return message.unpack(kind + await reader.readexactly(message.size - 1))
+
+
+def pack_codes(directions):
+    codes = 0
+    for i, d in enumerate(directions):
+        codes |= DIR_CODE[d] << (2 * i)
+    return codes
+
+
+def unpack_codes(codes, players):
+    return [DIRECTIONS[(codes >> (2 * i)) & 3] for i in range(players)]
+
+
+class LockstepServer:
+    """
+    Runs head to head games for connected clients, one tick at a time
+    """
+    def __init__(self, players=2, rate=TICK_RATE, delay=INPUT_DELAY, broadcaster=None):
+        """
+        Initialize server
+        :param broadcaster: spectate.Broadcaster to stream the games to, or None
+        """
+        self.players = players
+        self.rate = rate
+        self.delay = delay
+        self.broadcaster = broadcaster
+        # client writer per seat, None for an empty seat
+        self.writers = [None] * players
+        self.handlers = []
+        self.ready = asyncio.Event()
+        # direction changes waiting for their tick, per player: tick -> code
+        self.pending = [{} for i in range(players)]
+        self.tick = 0
+        self.late_inputs = 0
+        self.late_ticks = 0
+
+    async def _client(self, reader, writer):
+        if None not in self.writers:
+            writer.close()
+            return
+        index = self.writers.index(None)
+        self.writers[index] = writer
+        self.handlers.append(asyncio.current_task())
+        if None not in self.writers:
+            self.ready.set()
+        try:
+            while True:
+                message = await read_message(reader)
+                if message[0] == b'D':
+                    _, tick, code = message
+                    if tick <= self.tick:
+                        self.late_inputs += 1
+                    self.pending[index][tick] = code
+                elif message[0] == b'P':
+                    writer.write(PING.pack(*message))
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            # free the seat, games wait until it is taken again
+            self.writers[index] = None
+            self.pending[index].clear()
+            self.ready.clear()
+            writer.close()
+
+    def _broadcast(self, data):
+        for writer in self.writers:
+            if writer:
+                writer.write(data)
+
+    def _inputs(self, match):
+        # apply each player's latest change due by this tick, late ones included
+        for p, pending in zip(match.players, self.pending):
+            due = [tick for tick in pending if tick <= self.tick]
+            if due:
+                p.set_direction(*DIRECTIONS[pending[max(due)]])
+                for tick in due:
+                    del pending[tick]
+
+    async def play_game(self, seed=None):
+        """
+        Play one game with the connected clients
+        :return:    last TickResult, or None when a client left mid game
+        """
+        gbox = GameBox()
+        players = [Player(gbox, gx, gy, None, []) for (gx, gy), d in start_positions(self.players)]
+        match = Match(gbox, players)
+        match.reset(seed)
+        if self.broadcaster:
+            self.broadcaster.attach(match)
+            self.broadcaster.publish()
+        self.tick = 0
+        for pending in self.pending:
+            pending.clear()
+        for index, writer in enumerate(self.writers):
+            # a seat can empty before the game starts, the first tick then ends it
+            if writer:
+                writer.write(START.pack(b'S', index, self.players, match.seed, self.delay))
+
+        loop = asyncio.get_running_loop()
+        period = 1 / self.rate
+        deadline = loop.time() + period * self.delay
+        while True:
+            # keep to a fixed schedule rather than sleeping a period per tick
+            wait = deadline - loop.time()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            else:
+                self.late_ticks += 1
+            if not self.ready.is_set():
+                return None
+            deadline += period
+            self.tick += 1
+            self._inputs(match)
+            self._broadcast(TICK.pack(b'T', self.tick, pack_codes((p.dx, p.dy) for p in players)))
+            result = match.tick()
+            if self.broadcaster:
+                self.broadcaster.publish()
+            if result.game_over:
+                return result
+
+    async def serve(self, host='localhost', port=7777, games=None):
+        """
+        Accept clients then play games until stopped
+        :param games:   number of games to play, None for no limit
+        """
+        server = await asyncio.start_server(self._client, host, port)
+        async with server:
+            played = 0
+            while games is None or played < games:
+                # every seat taken, after a client leaves too
+                await self.ready.wait()
+                if await self.play_game():
+                    played += 1
+                await asyncio.sleep(RESTART_DELAY)
+            for writer in self.writers:
+                if writer:
+                    writer.close()
+            # give the clients a moment to hang up before the server goes
+            await asyncio.wait(self.handlers, timeout=1.0)
+
+
+class LockstepClient:
+    """
+    Keeps a copy of the match in step with the server
+    """
+    def __init__(self, match):
+        """
+        Initialize client
+        :param match:   match to step, its players in START_POSITIONS order
+        """
+        self.match = match
+        self.index = None
+        self.delay = INPUT_DELAY
+        self.tick = 0
+        self.rtt = None
+        self.writer = None
+        self.last_sent = None
+
+    async def connect(self, host='localhost', port=7777):
+        self.reader, self.writer = await asyncio.open_connection(host, port)
+
+    def send_direction(self, direction):
+        """
+        Ask for a direction change, applied INPUT_DELAY ticks from now
+        """
+        if self.index is None or direction == self.last_sent:
+            return
+        self.last_sent = direction
+        self.writer.write(DIRECTION.pack(b'D', self.tick + self.delay, DIR_CODE[direction]))
+
+    async def _ping(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            self.writer.write(PING.pack(b'P', loop.time()))
+            await asyncio.sleep(PING_INTERVAL)
+
+    def start(self, seed):
+        """
+        Start a game from the server's seed
+        """
+        self.match.reset(seed)
+
+    def step(self, codes):
+        """
+        Advance the match one tick with the directions the server applied
+        :return:    TickResult
+        """
+        for p, d in zip(self.match.players, unpack_codes(codes, len(self.match.players))):
+            p.set_direction(*d)
+        return self.match.tick()
+
+    async def run(self, on_start=None, on_tick=None, step=True):
+        """
+        Follow the server until the connection closes
+        :param on_start:    called with the seed when a game starts
+        :param on_tick:     called with each TickResult
+        :param step:        step the match here, when False on_tick gets the
+                            tick's direction codes to step() on another thread
+        """
+        loop = asyncio.get_running_loop()
+        pinger = asyncio.ensure_future(self._ping())
+        try:
+            while True:
+                message = await read_message(self.reader)
+                if message[0] == b'S':
+                    _, self.index, players, seed, self.delay = message
+                    self.tick = 0
+                    self.last_sent = None
+                    if step:
+                        self.start(seed)
+                    if on_start:
+                        on_start(seed)
+                elif message[0] == b'T':
+                    _, self.tick, codes = message
+                    update = self.step(codes) if step else codes
+                    if on_tick:
+                        on_tick(update)
+                elif message[0] == b'P':
+                    # smoothed round trip time
+                    rtt = loop.time() - message[1]
+                    self.rtt = rtt if self.rtt is None else self.rtt * 0.8 + rtt * 0.2
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            pinger.cancel()
+
+
+class ClientThread:
+    """
+    Runs a LockstepClient on its own event loop thread for a blocking game
+    loop. The game loop reads ('start', seed), ('tick', codes) and ('closed',
+    None) events from a queue and does the stepping itself, so the match is
+    only ever touched from one thread.
+    """
+    def __init__(self, match, host, port):
+        self.client = LockstepClient(match)
+        self.events = queue.Queue()
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self._run, args=(host, port), daemon=True)
+        self.thread.start()
+
+    def _run(self, host, port):
+        asyncio.set_event_loop(self.loop)
+        try:
+            self.loop.run_until_complete(self.client.connect(host, port))
+            self.loop.run_until_complete(self.client.run(
+                lambda seed: self.events.put(('start', seed)),
+                lambda codes: self.events.put(('tick', codes)), step=False))
+        except OSError as e:
+            print('network error: {}'.format(e))
+        self.events.put(('closed', None))
+
+    def send_direction(self, direction):
+        self.loop.call_soon_threadsafe(self.client.send_direction, direction)
+
+
+class NetComputerPlayer(ComputerPlayer):
+    """
+    ComputerPlayer copy in a networked match - it moves the way the server
+    says, its choose() only picks what to send
+    """
+    move = Player.move
+
+
+async def run_bot(host, port, games=None):
+    gbox = GameBox()
+    players = [NetComputerPlayer(gbox, gx, gy, None) for (gx, gy), d in START_POSITIONS]
+    match = Match(gbox, players)
+    client = LockstepClient(match)
+    await client.connect(host, port)
+    # directions sent, by the tick the server applies them on
+    sent = {}
+
+    def steer_ahead():
+        # a direction sent now applies client.delay ticks on, so choose it
+        # from where the match will be by then, stepping forward with the
+        # directions already sent and guessing everyone else steers as a
+        # ComputerPlayer would, then rewinding
+        me = players[client.index]
+        for tick in [tick for tick in sent if tick <= client.tick]:
+            del sent[tick]
+        state = match.snapshot()
+        for tick in range(client.tick + 1, client.tick + client.delay):
+            if tick in sent:
+                me.set_direction(*sent[tick])
+            for p in match.alive:
+                if p is not me:
+                    p.set_direction(*p.choose())
+            if match.tick().game_over:
+                break
+        # nothing to choose if we will have crashed by then whatever we send
+        direction = me.choose() if me in match.alive else None
+        match.restore(state)
+        if direction and direction != client.last_sent:
+            sent[client.tick + client.delay] = direction
+            client.send_direction(direction)
+
+    def start(seed):
+        sent.clear()
+        steer_ahead()
+
+    def steer(result):
+        if not result.game_over:
+            steer_ahead()
+
+    await client.run(on_start=start, on_tick=steer)
+
+
+async def serve(host, port, games, spectate_port=None):
+    broadcaster = None
+    if spectate_port:
+        from spectate import Broadcaster
+        broadcaster = Broadcaster()
+        viewers = asyncio.ensure_future(broadcaster.serve(host, spectate_port))
+    try:
+        await LockstepServer(broadcaster=broadcaster).serve(host, port, games)
+    finally:
+        if broadcaster:
+            viewers.cancel()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Snackade network play')
+    parser.add_argument('mode', choices=['server', 'bot'])
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=7777)
+    parser.add_argument('--games', type=int, default=None, help='games to serve, default no limit')
+    parser.add_argument('--spectate-port', type=int, default=None, help='port to stream games to spectators on')
+    args = parser.parse_args()
+    if args.mode == 'server':
+        asyncio.run(serve(args.host, args.port, args.games, args.spectate_port))
+    else:
+        asyncio.run(run_bot(args.host, args.port))
+
+
+if __name__ == '__main__':
+    main()
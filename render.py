@@ -0,0 +1,107 @@
+#!/usr/bin/python3
+"""
+  Snackade replay renderer - turn recorded games into frames, no window needed
+
+  Each replay is re-simulated and drawn tick by tick onto an offscreen
+  surface with the game's own GameBox drawing, as fast as it will go, and
+  saved as numbered PNG files or one raw RGB file of every frame. Replays are
+  shared out across worker processes:
+
+      python render.py games/*.snkr --out frames --format png --workers 4
+
+  A raw file is width * height * 3 bytes per frame, e.g. for ffmpeg:
+  -f rawvideo -pix_fmt rgb24 -s 750x580
+
+MIT License - see snackade.py
+"""
+
+import argparse
+import os
+
+# draw offscreen, SDL never opens a window
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+
+import pygame
+from concurrent.futures import ProcessPoolExecutor
+from time import perf_counter
+
+from replay import Replay
+from snackade import PLAYER_COLOURS, GameBox, dirty, display_game_status, draw_tick
+
+SCREEN_SIZE = (750, 580)
+
+
+def render(job):
+    """
+    Render one replay
+    :param job:     (replay path, output directory, 'png' or 'raw', frame stride)
+    :return:        (frames written, seconds taken)
+    """
+    path, out, fmt, every = job
+    start = perf_counter()
+    pygame.font.init()
+    with open(path, 'rb') as f:
+        replay = Replay(f.read())
+    name = os.path.splitext(os.path.basename(path))[0]
+
+    screen = pygame.Surface(SCREEN_SIZE)
+    gbox = GameBox(screen)
+    match = replay.start(gbox)
+    for p, colour in zip(match.players, PLAYER_COLOURS):
+        p.colour = colour
+    gbox.display_border()
+    for p in match.players:
+        gbox.draw_head(p)
+    display_game_status(screen, match.players)
+
+    raw = open(os.path.join(out, name + '.rgb'), 'wb') if fmt == 'raw' else None
+    frames = 0
+
+    def save(tick):
+        nonlocal frames
+        if raw:
+            raw.write(pygame.image.tobytes(screen, 'RGB'))
+        else:
+            pygame.image.save(screen, os.path.join(out, '{}-{:05d}.png'.format(name, tick)))
+        frames += 1
+
+    try:
+        save(0)
+        moving = match.alive
+        for tick, result in enumerate(replay.play(match), 1):
+            draw_tick(gbox, match, moving, result)
+            moving = match.alive
+            # nothing is shown, so the drawn areas are not needed
+            dirty.rects.clear()
+            if tick % every == 0 or result.game_over:
+                save(tick)
+    finally:
+        if raw:
+            raw.close()
+    return frames, perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Render Snackade replays to frames')
+    parser.add_argument('replays', nargs='+', help='replay files')
+    parser.add_argument('--out', default='frames', help='directory to write frames to')
+    parser.add_argument('--format', choices=['png', 'raw'], default='png')
+    parser.add_argument('--every', type=int, default=1, help='save every nth tick')
+    parser.add_argument('--workers', type=int, default=None, help='worker processes, default one per core')
+    args = parser.parse_args()
+    os.makedirs(args.out, exist_ok=True)
+
+    jobs = [(path, args.out, args.format, args.every) for path in args.replays]
+    start = perf_counter()
+    frames = busy = 0
+    with ProcessPoolExecutor(args.workers) as pool:
+        for path, (count, seconds) in zip(args.replays, pool.map(render, jobs)):
+            frames += count
+            busy += seconds
+    elapsed = perf_counter() - start
+    print('{} replays, {} frames in {:.1f}s: {:.0f} frames/s, {:.0f} frames/s per worker'.format(
+        len(jobs), frames, elapsed, frames / elapsed, frames / max(busy, 1e-9)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,185 @@
+#!/usr/bin/python3
+"""
+  Snackade replays - record games compactly and re-simulate them
+
+  A replay is the game seed plus the direction each player moved every tick,
+  which with the seeded Match is enough to play the game again exactly.
+  Layout, all little endian:
+
+      header  b'SNKR', version byte, player count byte, seed (8 bytes)
+      ticks   one byte per three players per tick, 2 bit direction codes
+      footer  END byte, ticks (4 bytes), crashed player bit mask (1 byte),
+              CRC32 of the final grid (4 bytes), points per player (4 bytes each)
+
+  Tick bytes never have the top bit set, so the END byte marks the footer and
+  a replay can be streamed to disk as the game is played. Re-simulating checks
+  the footer against the replayed game:
+
+      python replay.py games/*.snkr
+
+MIT License - see snackade.py
+"""
+
+import struct
+import sys
+import zlib
+from time import perf_counter
+
+from engine import DIRECTIONS, DIR_CODE, start_positions, GameBox, Match, Player
+
+MAGIC = b'SNKR'
+VERSION = 1
+END = 0x80
+
+HEADER = struct.Struct('<4sBBQ')
+FOOTER = struct.Struct('<BIBI')
+POINTS = struct.Struct('<I')
+
+# Players whose direction codes fit in one tick byte
+PLAYERS_PER_BYTE = 3
+
+
+def tick_bytes(players):
+    return (players + PLAYERS_PER_BYTE - 1) // PLAYERS_PER_BYTE
+
+
+def grid_crc(gbox):
+    return zlib.crc32(gbox.grid)
+
+
+class ReplayWriter:
+    """
+    Streams a game to a binary file object as it is played
+    """
+    def __init__(self, stream, match):
+        """
+        Start a replay, call after match.reset()
+        :param stream:  binary file object to write to
+        :param match:   match being played, on a flat grid of the standard board
+        """
+        if getattr(match.gbox, 'grid', None) is None:
+            raise ValueError('replays can only be recorded on the standard board')
+        self.stream = stream
+        self.match = match
+        # points carry over between games of a match, only this game's are kept
+        self.start_points = [p.points for p in match.players]
+        stream.write(HEADER.pack(MAGIC, VERSION, len(match.players), match.seed))
+
+    def record(self):
+        """
+        Record the moves of the tick just played
+        """
+        codes = bytearray(tick_bytes(len(self.match.players)))
+        for i, p in enumerate(self.match.players):
+            codes[i // PLAYERS_PER_BYTE] |= DIR_CODE[(p.dx, p.dy)] << (2 * (i % PLAYERS_PER_BYTE))
+        self.stream.write(codes)
+
+    def finish(self, result):
+        """
+        Write the footer once the game is over
+        :param result:  last TickResult of the game
+        """
+        crashed = 0
+        for i, p in enumerate(self.match.players):
+            if p in result.crashed:
+                crashed |= 1 << i
+        self.stream.write(FOOTER.pack(END, self.match.ticks, crashed, grid_crc(self.match.gbox)))
+        for p, start in zip(self.match.players, self.start_points):
+            self.stream.write(POINTS.pack(p.points - start))
+        self.stream.flush()
+
+
+class Replay:
+    """
+    A recorded game read back from bytes
+    """
+    def __init__(self, data):
+        magic, version, self.players, self.seed = HEADER.unpack_from(data)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError('not a version {} Snackade replay'.format(VERSION))
+        per_tick = tick_bytes(self.players)
+        start = HEADER.size
+        end = data.find(bytes([END]), start)
+        if end < 0 or (end - start) % per_tick:
+            raise ValueError('replay has no footer, the game was not finished')
+        self.moves = data[start:end]
+        self.per_tick = per_tick
+        _, self.ticks, self.crashed, self.crc = FOOTER.unpack_from(data, end)
+        self.points = [POINTS.unpack_from(data, end + FOOTER.size + POINTS.size * i)[0]
+                       for i in range(self.players)]
+
+    def directions(self, tick):
+        """
+        Directions of every player on a tick, counting from 0
+        """
+        codes = self.moves[tick * self.per_tick:(tick + 1) * self.per_tick]
+        return [DIRECTIONS[(codes[i // PLAYERS_PER_BYTE] >> (2 * (i % PLAYERS_PER_BYTE))) & 3]
+                for i in range(self.players)]
+
+    def start(self, gbox=None):
+        """
+        Set up the recorded game at its start
+        :param gbox:    game box to play on, default a new engine GameBox
+        :return:        match
+        """
+        gbox = gbox or GameBox()
+        players = [Player(gbox, gx, gy, None, []) for (gx, gy), d in start_positions(self.players)]
+        match = Match(gbox, players)
+        match.reset(self.seed)
+        return match
+
+    def play(self, match):
+        """
+        Play the recorded moves on a match from start(), one tick at a time
+        :return:    generator of each tick's TickResult
+        """
+        for tick in range(len(self.moves) // self.per_tick):
+            for p, (dx, dy) in zip(match.players, self.directions(tick)):
+                p.set_direction(dx, dy)
+            yield match.tick()
+
+    def simulate(self):
+        """
+        Play the game again from the recorded moves, no rendering
+        :return:    match after the last tick, last TickResult
+        """
+        match = self.start()
+        result = None
+        for result in self.play(match):
+            pass
+        return match, result
+
+    def verify(self):
+        """
+        Re-simulate and check the outcome matches the footer
+        :return:    True if the replayed game ends the same way
+        """
+        match, result = self.simulate()
+        crashed = 0
+        for i, p in enumerate(match.players):
+            if result and p in result.crashed:
+                crashed |= 1 << i
+        return (match.ticks == self.ticks and crashed == self.crashed and
+                grid_crc(match.gbox) == self.crc and
+                [p.points for p in match.players] == self.points)
+
+
+def main():
+    ticks = 0
+    failed = 0
+    start = perf_counter()
+    for name in sys.argv[1:]:
+        with open(name, 'rb') as f:
+            replay = Replay(f.read())
+        if not replay.verify():
+            print('{}: replay does not match the recorded result'.format(name))
+            failed += 1
+        ticks += replay.ticks
+    elapsed = perf_counter() - start
+    print('{} replays, {} failed, {} ticks re-simulated at {:.0f} ticks/s'.format(
+        len(sys.argv) - 1, failed, ticks, ticks / max(elapsed, 1e-9)))
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -29,20 +29,31 @@ OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 SOFTWARE.
 """
 
+from time import sleep, monotonic, perf_counter
+# start up is timed from here, before pygame loads
+LOADED = perf_counter()
+
+import atexit
+import csv
+import os
+import queue
 import pygame
 from pygame.mixer import Sound, get_init, pre_init
 from array import array
-from time import sleep
-from enum import Enum
-from random import randint
+from collections import deque
+from heapq import heappush, heappop
+from threading import Condition, Thread
 
-pre_init(44100, -16, 1, 2048)
-successes, failures = pygame.init()
+import engine
+from engine import GRID_XSIZE, GRID_YSIZE, START_POSITIONS, TICK_RATE, Player, ComputerPlayer, Match
+from replay import ReplayWriter
 
-font1 = pygame.font.SysFont("monospace", 16)
-font2 = pygame.font.SysFont("monospace", 32)
 clock = pygame.time.Clock()
 
+# Screen redraws per second while playing, and the most ticks run to catch up after a slow frame
+FRAME_RATE = 60
+MAX_CATCHUP = 3
+
 # Colours for the game
 BLACK = (0, 0, 0)
 WHITE = (255, 255, 255)
@@ -51,13 +62,19 @@ RED = (255, 0, 0)
 DARK_RED = (139, 0, 0)
 GREEN = (0, 255, 0)
 BLUE = (0, 0, 255)
-
-# Game piece / Sprite values - each sprint adds its value to a grid location
-GVAL_CLEAR = 0
-GVAL_BORDER = 1
-GVAL_PLAYER = 1
-GVAL_OCCUPIED = 1
-GVAL_SNACK = 10
+YELLOW = (255, 255, 0)
+CYAN = (0, 255, 255)
+ORANGE = (255, 165, 0)
+PURPLE = (160, 32, 240)
+PINK = (255, 105, 180)
+GREY = (160, 160, 160)
+
+# Player colours in start position order, and what the messages call them
+PLAYER_COLOURS = [GREEN, BLUE, YELLOW, CYAN, ORANGE, PURPLE, PINK, GREY]
+COLOUR_NAMES = {GREEN: 'Green', BLUE: 'Blue', YELLOW: 'Yellow', CYAN: 'Cyan',
+                ORANGE: 'Orange', PURPLE: 'Purple', PINK: 'Pink', GREY: 'Grey'}
+# Most players in an arena, one per colour
+MAX_PLAYERS = len(PLAYER_COLOURS)
 
 BORDER_RADIUS = 6
 BORDER_WIDTH = BORDER_RADIUS * 2
@@ -72,37 +89,54 @@ GRID_YOFF = BORDER_YOFF + BORDER_RADIUS + 2
 PLAYER_XSIZE = 32
 PLAYER_YSIZE = 32
 
-# Grid size - playing grid includes borders
-GRID_XSIZE = 23
-GRID_YSIZE = 15
+# Snack colour by snack value
+SNACK_COLOURS = {1: LIGHT_RED, 2: RED, 3: DARK_RED}
 
-# Directions for sprites
-UP = (0, -1)
-DOWN = (0, 1)
-LEFT = (-1, 0)
-RIGHT = (1, 0)
 
-# maps from distance to simple direction, e.g. 10 becomes 1, -10 becomes -1
-dir_map = lambda x: 0 if x == 0 else abs(x) // x
+class StartupTimer:
+    """
+    Times the steps from loading this module to the intro screen
+    """
+    def __init__(self):
+        self.steps = []
+        self.last = LOADED
 
+    def step(self, name):
+        """
+        Record how long a step took, since the last one
+        """
+        now = perf_counter()
+        self.steps.append((name, (now - self.last) * 1000))
+        self.last = now
 
-# Set up grid to check for collisions
-def init_grid(grid):
+    def report(self):
+        return 'start up {:.0f} ms: '.format(sum(ms for name, ms in self.steps)) + \
+            ', '.join('{} {:.1f}'.format(name, ms) for name, ms in self.steps)
 
-    if grid == None:
-        grid = [[] for x in range(0, GRID_XSIZE+1)]
 
-    for x in range(0, GRID_XSIZE+1):
-        grid[x]= [0 for y in range(0, GRID_YSIZE+1)]
+startup = StartupTimer()
 
-    for x in range(0,GRID_XSIZE+1):
-        grid[x][0] = GVAL_BORDER
-        grid[x][GRID_YSIZE] =  GVAL_BORDER
-    for y in range(0,GRID_YSIZE+1):
-        grid[0][y] = GVAL_BORDER
-        grid[GRID_XSIZE][y] = GVAL_BORDER
 
-    return grid
+def init():
+    """
+    Start only the pygame modules the game uses, then open the window and
+    build the fonts and tones it needs up front
+    :return:    screen
+    """
+    startup.step('import')
+    pre_init(44100, -16, 1, 2048)
+    pygame.display.init()
+    pygame.font.init()
+    pygame.mixer.init()
+    startup.step('init')
+    screen = pygame.display.set_mode((750, 580))
+    startup.step('window')
+    font_cache.get(TEXT_SIZE)
+    font_cache.get(TITLE_SIZE)
+    startup.step('fonts')
+    tone_bank.preload()
+    startup.step('tones')
+    return screen
 
 
 class Tone(Sound):
@@ -114,32 +148,158 @@ class Tone(Sound):
 
     def build_samples(self):
         period = int(round(get_init()[0] / self.frequency))
-        samples = array("h", [0] * period)
         amplitude = 2 ** (abs(get_init()[1]) - 1) - 1
-        for time in range(period):
-            if time < period / 2:
-                samples[time] = amplitude
-            else:
-                samples[time] = -amplitude
-        return samples
+        # square wave - first half of the period high, the rest low
+        high = (period + 1) // 2
+        return array("h", [amplitude]) * high + array("h", [-amplitude]) * (period - high)
+
+
+class ToneBank:
+    """
+    Tones built once per frequency and reused, so playing a note allocates nothing
+    """
+    # Frequencies used by the sound effects: crash, chomp and the start sweep
+    CRASH_FREQ = 40
+    CHOMP_FREQS = [400, 540, 660]
+    START_FREQS = list(range(100, 1001, 50))
+
+    def __init__(self):
+        self.tones = {}
+
+    def get(self, frequency):
+        """
+        Get the tone for a frequency, building it on first use
+        :param frequency:   tone frequency in Hz
+        :return:            Tone
+        """
+        tone = self.tones.get(frequency)
+        if tone is None:
+            tone = self.tones[frequency] = Tone(frequency)
+        return tone
+
+    def preload(self):
+        """
+        Build every music note and sound effect tone up front
+        """
+        for freq in [self.CRASH_FREQ] + self.CHOMP_FREQS + self.START_FREQS + \
+                list(NoteLoop.NOTE_NAMES.values()):
+            if freq:
+                self.get(freq)
+
+
+tone_bank = ToneBank()
+
+
+class SoundScheduler:
+    """
+    Plays queued tone events at their due time from a background thread, so
+    sound effects and music never sleep on the game loop
+    """
+    # Mixer channels reserved for music and for sound effects
+    MUSIC_CHANNEL = 0
+    EFFECT_CHANNELS = [1, 2, 3]
+
+    def __init__(self):
+        self.events = []        # heap of (due time, order, frequency, loops, channel)
+        self.order = 0
+        self.next_effect = 0
+        self.ready = Condition()
+        self.channels = None
+        self.thread = None
+        self.running = False
+
+    def start(self):
+        """
+        Reserve the mixer channels and start the playing thread
+        """
+        count = len(self.EFFECT_CHANNELS) + 1
+        pygame.mixer.set_reserved(count)
+        self.channels = [pygame.mixer.Channel(i) for i in range(count)]
+        self.running = True
+        self.thread = Thread(target=self._run, daemon=True)
+        self.thread.start()
+        # runs ahead of pygame's own exit handler when the window is closed
+        atexit.register(self.stop)
+
+    def stop(self):
+        """
+        Drop queued sounds and stop the playing thread, before the mixer quits
+        """
+        if self.thread is None:
+            return
+        with self.ready:
+            self.events.clear()
+            self.running = False
+            self.ready.notify()
+        self.thread.join()
+        self.thread = None
+
+    def schedule(self, frequency, loops, delay=0.0, channel=MUSIC_CHANNEL):
+        """
+        Queue a tone to play
+        :param frequency:   tone frequency in Hz
+        :param loops:       extra times to repeat the tone
+        :param delay:       seconds from now to play it
+        :param channel:     reserved channel to play it on
+        """
+        if self.thread is None:
+            self.start()
+        with self.ready:
+            heappush(self.events, (monotonic() + delay, self.order, frequency, loops, channel))
+            self.order += 1
+            self.ready.notify()
+
+    def sequence(self, frequencies, loops, step):
+        """
+        Queue tones one after the other on the next effect channel
+        :param frequencies: tone frequencies in Hz
+        :param loops:       extra times to repeat each tone
+        :param step:        seconds between tones
+        """
+        channel = self.EFFECT_CHANNELS[self.next_effect]
+        self.next_effect = (self.next_effect + 1) % len(self.EFFECT_CHANNELS)
+        for i, freq in enumerate(frequencies):
+            self.schedule(freq, loops, i * step, channel)
+
+    def pending(self):
+        with self.ready:
+            return len(self.events)
+
+    def _run(self):
+        while True:
+            with self.ready:
+                while self.running and not self.events:
+                    self.ready.wait()
+                if not self.running:
+                    return
+                wait = self.events[0][0] - monotonic()
+                if wait > 0:
+                    # an earlier event may be queued while waiting, so check again
+                    self.ready.wait(wait)
+                    continue
+                _, _, freq, loops, channel = heappop(self.events)
+            self.channels[channel].play(tone_bank.get(freq), loops)
+
+
+sound_scheduler = SoundScheduler()
 
 
 def sound_start():
-    freq = 100
-    for i in range(1,20):
-        Tone(freq).play(5)
-        sleep(0.1)
-        freq += 50
+    sound_scheduler.sequence(ToneBank.START_FREQS, 5, 0.1)
 
 def sound_chomp():
-    Tone(400).play(4)
-    sleep(0.05)
-    Tone(540).play(4)
-    sleep(0.05)
-    Tone(660).play(4)
+    sound_scheduler.sequence(ToneBank.CHOMP_FREQS, 4, 0.05)
 
 def sound_crash():
-    Tone(40).play(5)
+    sound_scheduler.sequence([ToneBank.CRASH_FREQ], 5, 0)
+
+def wait_sounds():
+    """
+    Wait for queued sounds to play, keeping the window responsive
+    """
+    while sound_scheduler.pending():
+        pygame.event.pump()
+        clock.tick(20)
 
 
 class NoteLoop:
@@ -163,7 +323,7 @@ class NoteLoop:
         if freq_name in self.NOTE_NAMES:
             freq = self.NOTE_NAMES[freq_name]
             if freq:
-                Tone(freq).play(duration)
+                sound_scheduler.schedule(freq, duration)
         else:
             print('note error on {}'.format(freq_name))
         self.next +=1
@@ -171,12 +331,35 @@ class NoteLoop:
             self.next = 0
 
 
+class DirtyRects:
+    """
+    Collects the screen areas drawn during a frame so the display is flushed
+    once with just those areas
+    """
+    def __init__(self):
+        self.rects = []
+
+    def add(self, rect):
+        self.rects.append(rect)
+
+    def flush(self):
+        if self.rects:
+            pygame.display.update(self.rects)
+            self.rects = []
+
+
+dirty = DirtyRects()
+
+
 def wait_anykey():
     """
     Waits for any key to be pressed
     :return:    alpha key that was pressed or None
     """
 
+    # show anything drawn before waiting on the player
+    dirty.flush()
+
     # pump the events and wait a bit to get them flowing
     pygame.event.pump()
     sleep(0.2)
@@ -194,31 +377,186 @@ def wait_anykey():
             return ' '
 
 
-def write_text(screen, text, x, y, font = font1):
+class FontCache:
+    """
+    Fonts opened once per size. Looking up a system font scans every font
+    installed, so the font file is only looked up once per run.
+    """
+    NAME = 'monospace'
+
+    def __init__(self):
+        self.fonts = {}
+        self.path = None
+
+    def get(self, size):
+        font = self.fonts.get(size)
+        if font is None:
+            if self.path is None:
+                # None when there is no such font, which gets pygame's default font
+                self.path = pygame.font.match_font(self.NAME) or ''
+            font = self.fonts[size] = pygame.font.Font(self.path or None, size)
+        return font
+
+
+font_cache = FontCache()
+TEXT_SIZE = 16
+TITLE_SIZE = 32
+
+
+class GlyphCache:
+    """
+    Characters rendered once per font, text is drawn by blitting them side by side
+    """
+    def __init__(self):
+        self.glyphs = {}
+
+    def glyph(self, font, char, colour=WHITE):
+        glyph = self.glyphs.get((font, char, colour))
+        if glyph is None:
+            glyph = self.glyphs[(font, char, colour)] = font.render(char, 10, colour)
+        return glyph
+
+    def blit(self, screen, font, text, x, y, colour=WHITE):
+        """
+        Draw a line of text
+        :return:    rect covering the text
+        """
+        left = x
+        for char in text:
+            glyph = self.glyph(font, char, colour)
+            screen.blit(glyph, (x, y))
+            x += glyph.get_width()
+        return pygame.Rect(left, y, x - left, font.get_linesize())
+
+
+glyph_cache = GlyphCache()
+
+
+def write_text(screen, text, x, y, font = None, colour = WHITE):
+    font = font or font_cache.get(TEXT_SIZE)
     y_offset = 0
     for line in text:
-        msg1 = font.render(line, 10, (255, 255, 255))
-        screen.blit(msg1, (x,y + y_offset))
+        dirty.add(glyph_cache.blit(screen, font, line, x, y + y_offset, colour))
         y_offset += 18
-    pygame.display.update()
 
 
 def clear_text(screen, lines, x, y, chars):
     y_offset = 18 * lines
     blankmsg = pygame.Rect((x, y), ((chars * 10), y_offset))
-    pygame.draw.rect(screen, BLACK, blankmsg)
-    pygame.display.update()
+    dirty.add(pygame.draw.rect(screen, BLACK, blankmsg))
 
 
-def end_game(screen, p1crash, p2crash):
-    if p1crash and p2crash:
+class FrameProfiler:
+    """
+    Times each phase of the frames in play(). Shows rolling averages and
+    worst cases above the arena and can stream every frame to a CSV file.
+    When off each phase mark is one attribute test.
+    """
+    PHASES = ('wait', 'events', 'tick', 'draw', 'sound', 'flush')
+    # Frames the rolling stats cover, and how often the overlay is redrawn
+    WINDOW = 120
+    REFRESH = 15
+    OVERLAY = (5, 6)
+
+    def __init__(self):
+        self.enabled = False
+        self.frames = deque(maxlen=self.WINDOW)
+        self.frame = None
+        self.count = 0
+        self.csv_file = None
+        self.writer = None
+
+    def open_csv(self, path):
+        """
+        Stream per frame timings in milliseconds to a CSV file, and turn profiling on
+        """
+        self.csv_file = open(path, 'w', newline='')
+        self.writer = csv.writer(self.csv_file)
+        self.writer.writerow(('frame', 'game_tick') + self.PHASES + ('busy',))
+        atexit.register(self.close)
+        self.enabled = True
+
+    def close(self):
+        if self.csv_file:
+            self.csv_file.close()
+            self.csv_file = self.writer = None
+
+    def toggle(self, screen):
+        self.enabled = not self.enabled
+        self.frames.clear()
+        self.frame = None
+        if not self.enabled:
+            # the overlay covers the title while it is shown
+            clear_text(screen, 2, *self.OVERLAY, 72)
+            display_title(screen)
+
+    def begin_frame(self):
+        """
+        Start timing a frame, the time until the next mark() is waiting on the clock
+        """
+        if self.enabled:
+            self.frame = [0.0] * len(self.PHASES)
+            self.last = perf_counter()
+
+    def mark(self, phase):
+        """
+        Charge the time since the last mark to a phase
+        :param phase:   index into PHASES
+        """
+        if self.frame:
+            now = perf_counter()
+            self.frame[phase] += now - self.last
+            self.last = now
+
+    def end_frame(self, screen, tick):
+        """
+        Record the frame and refresh the overlay now and then
+        :param tick:    match tick the frame showed
+        """
+        if not self.frame:
+            return
+        frame = [t * 1000 for t in self.frame]
+        busy = sum(frame[1:])
+        self.frames.append(frame + [busy])
+        self.count += 1
+        if self.writer:
+            self.writer.writerow([self.count, tick] + ['{:.3f}'.format(t) for t in frame + [busy]])
+        if self.count % self.REFRESH == 0:
+            self.draw(screen)
+        self.frame = None
+
+    def draw(self, screen):
+        columns = list(zip(*self.frames))
+        means = [sum(c) / len(c) for c in columns]
+        worst = [max(c) for c in columns]
+        fps = 1000 / max(sum(means[:-1]), 1e-3)
+        x, y = self.OVERLAY
+        clear_text(screen, 2, x, y, 72)
+        write_text(screen, [self._line('avg', means) + ' {:4.0f} fps'.format(fps),
+                            self._line('max', worst)], x, y)
+
+    def _line(self, label, times):
+        names = ('ev', 'tick', 'draw', 'snd', 'flip')
+        return '{} ms '.format(label) + ' '.join('{} {:5.2f}'.format(name, t)
+                                                for name, t in zip(names, times[1:-1])) + \
+            ' ={:6.2f}'.format(times[-1])
+
+
+profiler = FrameProfiler()
+WAIT, EVENTS, TICK, DRAW, SOUND, FLUSH = range(len(FrameProfiler.PHASES))
+
+
+def end_game(screen, match):
+    if match.alive:
+        write_text(screen, ['{} player wins!'.format(COLOUR_NAMES[match.alive[0].colour])], 250, 524)
+    elif len(match.players) == 2:
         write_text(screen, ['Both players crashed!!'], 250, 524)
-    elif p1crash:
-        write_text(screen, ['Blue player wins!'], 250, 524)
     else:
-        write_text(screen, ['Green player wins!'], 250, 524)
+        write_text(screen, ['Everyone crashed!!'], 250, 524)
+    dirty.flush()
     sleep(2)
     clear_text(screen, 1, 250, 524, 25)
+    dirty.flush()
 
 
 def play_again(screen):
@@ -228,10 +566,14 @@ def play_again(screen):
     return inkey == 'y'
 
 
+def display_title(screen):
+    write_text(screen, ['Snackade!'], 280, 6, font_cache.get(TITLE_SIZE))
+
+
 # Display intro and get the game play selection
-#     return TRUE if computer player, FALSE if head to head
+#     return 'h' for head to head, 'c' for computer, 'e' for expert or 'm' for hard computer
 def intro_select(screen):
-    write_text(screen, ['Snackade!'],280, 6, font2)
+    display_title(screen)
     write_text(screen, ['         Eat snacks and cut the other',
                         '         player off without crashing!',
                         ' ',
@@ -243,24 +585,37 @@ def intro_select(screen):
                         '       (down)                    (down)',
                         ' ',
                         ' ',
-                        '          Press h to play head to head or',
-                        '          Press c to play the computer'], 150, 200)
+                        '          Press h to play head to head,',
+                        '          Press c to play the computer,',
+                        '          Press e to play the expert computer or',
+                        '          Press m to play the hard computer'], 150, 200)
+    dirty.flush()
+    startup.step('intro')
     while True:
         key = wait_anykey()
-        if key == 'h' or key == 'c':
+        if key in ('h', 'c', 'e', 'm'):
             break
 
-    if key == 'c':
+    if key != 'h':
         clear_text(screen, 5, 410, 272, 20)
-        write_text(screen, ['    Computer!'], 420, 308)
+        write_text(screen, [{'c': '    Computer!', 'e': '    Expert!', 'm': '    Hard!'}[key]], 420, 308)
+        dirty.flush()
         sleep(2)
-    clear_text(screen, 13, 150, 200, 50)
-    return key == 'c'
-
-def display_game_status(screen, p1, p2):
-    clear_text(screen, 2, 250, 541, 25)
-    write_text(screen, ['Green Points:{:2d}  Wins:{:2d}'.format(p1.points, p1.wins),
-                        'Blue  Points:{:2d}  Wins:{:2d}'.format(p2.points, p2.wins)], 250, 541)
+    clear_text(screen, 15, 150, 200, 50)
+    return key
+
+def display_game_status(screen, players):
+    if len(players) == 2:
+        clear_text(screen, 2, 250, 541, 25)
+        write_text(screen, ['{:5s} Points:{:2d}  Wins:{:2d}'.format(COLOUR_NAMES[p.colour], p.points, p.wins)
+                            for p in players], 250, 541)
+        return
+    # a column per player in the player's colour
+    clear_text(screen, 2, 250, 541, 50)
+    write_text(screen, ['Points', 'Wins'], 250, 541)
+    for i, p in enumerate(players):
+        write_text(screen, ['{:3d}'.format(p.points), '{:3d}'.format(p.wins)], 320 + 30 * i, 541,
+                   colour=p.colour)
 
 
 # Fancy rectangle with offset sides
@@ -283,10 +638,54 @@ class FRect(pygame.Rect):
         pygame.draw.rect(screen, colour, rect_h, offset)
 
 
+class SpriteCache:
+    """
+    Segment, crash and snack images drawn once per colour and then just blitted
+    """
+    # Colour left transparent around the shapes
+    KEY = (255, 0, 255)
+
+    SEG_SIZE = (PLAYER_XSIZE-3, PLAYER_YSIZE-3)
+    CRASH_SIZE = (PLAYER_XSIZE-5, PLAYER_YSIZE-5)
+    SNACK_SIZE = (18, 18)
+
+    def __init__(self):
+        self.sprites = {}
+
+    def _sprite(self, kind, colour, size, draw):
+        sprite = self.sprites.get((kind, colour))
+        if sprite is None:
+            sprite = pygame.Surface(size)
+            sprite.fill(self.KEY)
+            draw(sprite, pygame.Rect((0, 0), size))
+            sprite.set_colorkey(self.KEY, pygame.RLEACCEL)
+            self.sprites[(kind, colour)] = sprite
+        return sprite
+
+    def segment(self, colour):
+        return self._sprite('segment', colour, self.SEG_SIZE,
+                            lambda s, r: FRect(r.topleft, r.size).draw(s, colour, 3))
+
+    def crash(self, colour):
+        return self._sprite('crash', colour, self.CRASH_SIZE,
+                            lambda s, r: pygame.draw.rect(s, colour, r, 10))
+
+    def snack(self, colour):
+        return self._sprite('snack', colour, self.SNACK_SIZE,
+                            lambda s, r: pygame.draw.rect(s, colour, r, 6, 6))
+
+
+sprite_cache = SpriteCache()
+
+
 # Class to hold all the game presentation data and methods
-class GameBox:
-    def __init__(self, screen):
+class GameBox(engine.GameBox):
+    def __init__(self, screen, *args):
+        super().__init__(*args)
         self.screen = screen
+        # cells the view is scrolled by, the whole arena fits so never here
+        self.camera_x = 0
+        self.camera_y = 0
         self.border = pygame.Rect((BORDER_XOFF, BORDER_YOFF),
                                   (GRID_XSIZE * PLAYER_XSIZE - BORDER_RADIUS - 3,
                                    GRID_YSIZE * PLAYER_YSIZE - BORDER_RADIUS - 3))
@@ -294,366 +693,435 @@ class GameBox:
         self.game_area = pygame.Rect((GRID_XOFF + BORDER_RADIUS - 1, GRID_YOFF + BORDER_RADIUS - 1),
                                     ((GRID_XSIZE - 1) * PLAYER_XSIZE - 2,
                                      (GRID_YSIZE - 1) * PLAYER_YSIZE - 2))
-        self.grid = init_grid(None)
-        self.snack_location = None
 
     def display_border(self):
-        pygame.draw.rect(self.screen, WHITE, self.border, BORDER_WIDTH, 8)
+        dirty.add(pygame.draw.rect(self.screen, WHITE, self.border, BORDER_WIDTH, 8))
 
     def clear_game_area(self):
-        pygame.draw.rect(self.screen, BLACK, self.game_area)
+        dirty.add(pygame.draw.rect(self.screen, BLACK, self.game_area))
 
     def screen_x(self, gx):
-        return (gx-1) * PLAYER_XSIZE + GRID_XOFF
+        return (gx-1-self.camera_x) * PLAYER_XSIZE + GRID_XOFF
 
     def screen_y(self, gy):
-        return (gy-1) * PLAYER_YSIZE + GRID_YOFF
-
-    def grid_reset(self):
-        self.grid = init_grid(self.grid)
-        self.snack_location = None
+        return (gy-1-self.camera_y) * PLAYER_YSIZE + GRID_YOFF
 
-    def grid_setval(self, gx, gy, value):
-        self.grid[gx][gy] = value
+    def follow(self, p, players):
+        """
+        Keep a player in view, the whole arena always is here
+        :return:    True when the view scrolled and was redrawn
+        """
+        return False
 
-    def grid_upval(self, gx, gy, value):
-        self.grid[gx][gy] += value
-        if value == GVAL_SNACK:
-            self.snack_location = (gx, gy)
-        elif value == -GVAL_SNACK:
-            self.snack_location = None
+    def draw_seg(self, gx, gy, colour):
+        dirty.add(self.screen.blit(sprite_cache.segment(colour),
+                                   (self.screen_x(gx)+5, self.screen_y(gy)+5)))
 
-    def grid_val(self, gx, gy):
-        return self.grid[gx][gy]
+    def draw_snack(self, snack, colour=None):
+        """
+        Draw snack, or erase it when colour is BLACK
+        """
+        if colour is None:
+            colour = SNACK_COLOURS[snack.value]
+        dirty.add(self.screen.blit(sprite_cache.snack(colour),
+                                   (self.screen_x(snack.gx)+10, self.screen_y(snack.gy)+10)))
 
+    def draw_head(self, p):
+        self.draw_seg(p.gx, p.gy, p.colour)
 
-class GridSprite:
+    def draw_player(self, p):
+        # draw head and remove tail
+        self.draw_seg(p.gx, p.gy, p.colour)
+        self.erase_tail(p)
 
-    def __init__(self, gbox, gx, gy, colour, sprite_value):
-        self.gbox = gbox
-        self.colour = colour
-        self.sprite_value = sprite_value
+    def erase_tail(self, p):
+        tx, ty = p.tail
+        if self.grid_val(tx, ty) == engine.GVAL_CLEAR:
+            self.draw_seg(tx, ty, BLACK)
 
-    def place(self, gx, gy):
+    def draw_slide(self, p, ox, oy, along):
         """
-        Place sprite on grid by setting its value
+        Draw a player's head part way from its last cell to its current one
+        :param ox, oy:  cell the head is moving from
+        :param along:   fraction of the way there, 0 to 1
+        :return:        rect drawn, for erase_slide()
         """
-        self.gx = gx
-        self.gy = gy
-        self.gbox.grid_upval(gx, gy, self.sprite_value)
+        x = self.screen_x(ox) + (self.screen_x(p.gx) - self.screen_x(ox)) * along
+        y = self.screen_y(oy) + (self.screen_y(p.gy) - self.screen_y(oy)) * along
+        rect = self.screen.blit(sprite_cache.segment(p.colour), (round(x)+5, round(y)+5))
+        dirty.add(rect)
+        return rect
 
-    def remove(self, gx, gy):
+    def erase_slide(self, p, rect, ox, oy):
         """
-        Remove sprite from grid, subtract value from grid location
+        Erase a head drawn by draw_slide() and put back the body segment under it
         """
-        self.gbox.grid_upval(gx, gy, -self.sprite_value)
-
-    def location(self):
-        return self.gx, self.gy
-
+        dirty.add(self.screen.fill(BLACK, rect))
+        self.draw_seg(ox, oy, p.colour)
 
-class Snack(GridSprite):
-    def __init__(self, gbox):
-        # find an empty spot on the grid for the snack
-        while True:
-            gx = randint(2,GRID_XSIZE-1)
-            gy = randint(2,GRID_YSIZE-1)
-            if gbox.grid_val(gx, gy) == GVAL_CLEAR:
-                break
-
-        # set value and colour of snack
-        self.value = randint(1,3)
-        if self.value > 2:
-            colour = DARK_RED
-        elif self.value > 1:
-            colour = RED
-        else:
-            colour = LIGHT_RED
-
-        super().__init__(gbox, gx, gy, colour, GVAL_SNACK)
-        self.place(gx, gy)
-        self.image = pygame.Surface((PLAYER_XSIZE, PLAYER_YSIZE))
-        self.image.fill(colour)
-        self.rect = pygame.Rect(gbox.screen_x(self.gx)+10, gbox.screen_y(self.gy)+10, 18, 18)
-        pygame.draw.rect(gbox.screen, colour, self.rect, 6, 6)
-
-    def clear(self):
-        """
-        Clear snack from screen and remove value from grid
-        """
-        self.image.fill(BLACK)
-        pygame.draw.rect(self.gbox.screen, BLACK, self.rect, 6, 6)
-        self.remove(self.gx, self.gy)
-
-
-class Player(GridSprite):
-
-    class Status(Enum):
-        CLEAR = 0
-        CHOMP = 1
-        COLLISION = 2
-
-    def __init__(self, gbox, gx, gy, colour, move_chars):
-        """
-        Initialize player
-        :param screen:  screen to draw player
-        :param gx:      grid x to start player
-        :param gy:      grid y to start player
-        :param colour:  colour of player
-        :param sprite_value: value to place on the grid for player
-        :param move_chars:   list with up,down,left,right characters for control
-        """
-        super().__init__(gbox, gx, gy, colour, GVAL_PLAYER)
-        self.wins = 0
-        self.points = 0
-        self.image = pygame.Surface((PLAYER_XSIZE, PLAYER_YSIZE))
-        self.image.fill(self.colour)
-        self.set_head(gx, gy)
-        self.move_key = {}
-        # set up, down, left, right vectors for keys if defined
-        if len(move_chars) == 4:
-            self.move_key[ord(move_chars[0])] = UP
-            self.move_key[ord(move_chars[1])] = DOWN
-            self.move_key[ord(move_chars[2])] = LEFT
-            self.move_key[ord(move_chars[3])] = RIGHT
-        else:
-            self.move_key = []
+    def draw_crash(self, p):
+        gx = p.gx - p.dx
+        gy = p.gy - p.dy
+        dirty.add(self.screen.blit(sprite_cache.crash(p.colour),
+                                   (self.screen_x(gx)+6, self.screen_y(gy)+6)))
 
-        self.rect = pygame.Rect(gbox.screen_x(self.gx), gbox.screen_y(self.gy),
-                                gbox.screen_x(self.gx + 1), gbox.screen_y(self.gy + 1))
-        self.status = self.Status.CLEAR
 
-    def set_head(self, gx, gy):
-        self.place(gx, gy)
-        self.trail = []
-        self.grow(2)
-        self.trail.append((self.gx, self.gy))
-        self._draw_seg(self.gx, self.gy, self.colour)
+class LargeGameBox(GameBox, engine.ChunkedGameBox):
+    """
+    Game box for a board bigger than the window, see engine.ChunkedGameBox.
+    The arena shows a view of the board that scrolls to keep a player in it,
+    and only cells inside the view are drawn, so drawing costs the same
+    whatever the size of the board.
+    """
+    # Cells across and down the view, and how close to its edge a followed head gets
+    VIEW_XCELLS = GRID_XSIZE - 1
+    VIEW_YCELLS = GRID_YSIZE - 1
+    MARGIN = 4
 
-    def set_direction(self, dx, dy):
+    def __init__(self, screen, xsize, ysize):
         """
-        Sets player's direction
-        :param dx:  dx part of direction vector
-        :param dy:  dy part of direction vector
-        :return:
+        Initialize large game box
+        :param xsize:   grid x of the board's right border
+        :param ysize:   grid y of the board's bottom border
         """
-        self.dx, self.dy = dx, dy
+        super().__init__(screen, xsize, ysize)
+        # colour of every body segment, in view or not, to redraw after a scroll
+        self.colours = {}
 
-    def grow(self, segments, points=0):
-        """
-        Grow the player
-        :param segments:    number of segments to grow
-        :param points:      points to add to score, default 0
-        :return:            None
-        """
-        for i in range(0,segments):
-            self.trail.append((self.gx,self.gy))
-            self.place(self.gx, self.gy)
-        self.points += points
+    def visible(self, gx, gy):
+        return 0 < gx - self.camera_x <= self.VIEW_XCELLS and 0 < gy - self.camera_y <= self.VIEW_YCELLS
 
-    def move(self):
-        # return if no move
-        if not (self.dx or self.dy):
-            return
+    def clear_game_area(self):
+        super().clear_game_area()
+        self.colours.clear()
 
-        self.place(self.gx + self.dx, self.gy + self.dy)
-        self.trail.append((self.gx, self.gy))
-        self.tail = self.trail.pop(0)
-        self.remove(self.tail[0], self.tail[1])
-
-    def update_status(self):
-        # check for collisions and chomping...
-        value = self.gbox.grid_val(self.gx, self.gy)
-        if (value > GVAL_PLAYER and value < GVAL_SNACK) or \
-          value == GVAL_PLAYER + GVAL_PLAYER + GVAL_SNACK:
-            self.status = self.Status.COLLISION
-        elif value == GVAL_PLAYER + GVAL_SNACK:
-            self.status = self.Status.CHOMP
+    def draw_seg(self, gx, gy, colour):
+        cell = gx * self.ycells + gy
+        if colour == BLACK:
+            self.colours.pop(cell, None)
         else:
-            self.status = self.Status.CLEAR
-
-    def _draw_seg(self, gx, gy, colour):
-        frect = FRect((self.gbox.screen_x(gx)+5, self.gbox.screen_y(gy)+5),
-                                  (PLAYER_XSIZE-3, PLAYER_YSIZE-3))
-        frect.draw(self.gbox.screen, colour, 3)
-
-    def draw(self):
-        # draw head and remove tail
-        self._draw_seg(self.gx, self.gy, self.colour)
-        tx, ty = self.tail
-        if self.gbox.grid_val(tx, ty) == GVAL_CLEAR:
-            self._draw_seg(tx, ty, BLACK)
-
-    def draw_crash(self):
-        gx = self.gx - self.dx
-        gy = self.gy - self.dy
-
-        rect = pygame.Rect((self.gbox.screen_x(gx)+6, self.gbox.screen_y(gy)+6),
-                                  (PLAYER_XSIZE-5, PLAYER_YSIZE-5))
-        pygame.draw.rect(self.gbox.screen, self.colour, rect, 10)
-
-
-class ComputerPlayer(Player):
-
-    RIGHT_TURN = {UP:RIGHT, RIGHT:DOWN, DOWN:LEFT, LEFT:UP}
-    LEFT_TURN  = {UP:LEFT, LEFT:DOWN, DOWN:RIGHT, RIGHT:UP}
-
-    # Dictionary of turns to make when a snack appears. Given the direction of the
-    # snack and the current direction of the computer player, give the direction to
-    # head to go towards the snack
-    #
-    #  Direction of snack, current direction -> direction to head
-    #
-    SNACK_TURN = {
-        (0, -1):    { UP:UP,    DOWN:LEFT,  LEFT:UP,    RIGHT:UP},
-        (1, -1):    { UP:UP,    DOWN:RIGHT, LEFT:UP,    RIGHT:RIGHT},
-        (1,  0):    { UP:RIGHT, DOWN:RIGHT, LEFT:UP,    RIGHT:RIGHT},
-        (1,  1):    { UP:RIGHT, DOWN:RIGHT, LEFT:DOWN,  RIGHT:RIGHT},
-        (0,  1):    { UP:RIGHT, DOWN:DOWN,  LEFT:DOWN,  RIGHT:DOWN},
-        (-1, 1):    { UP:LEFT,  DOWN:DOWN,  LEFT:LEFT,  RIGHT:DOWN},
-        (-1, 0):    { UP:LEFT,  DOWN:LEFT,  LEFT:LEFT,  RIGHT:DOWN},
-        (-1, -1):   { UP:UP,    DOWN:LEFT,  LEFT:LEFT,  RIGHT:UP}
-    }
-
-    # Set the computer player up just like regular player, except no key controls
-    def __init__(self, gbox, gx, gy, colour):
-        super().__init__(gbox, gx, gy, colour, [])
-
-    def move(self):
-        # calculate turn options
-        turn_options = [(self.dx, self.dy),
-                        self.RIGHT_TURN[(self.dx, self.dy)],
-                        self.LEFT_TURN[(self.dx, self.dy)]]
-
-        # if there is a snack then head towards it, otherwise default same direction
-        if self.gbox.snack_location:
-            snack_x, snack_y = self.gbox.snack_location
-            sx, sy = dir_map(snack_x - self.gx), dir_map(snack_y - self.gy)
-            dx, dy = self.SNACK_TURN[(sx, sy)][(self.dx, self.dy)]
+            self.colours[cell] = colour
+        if self.visible(gx, gy):
+            super().draw_seg(gx, gy, colour)
+
+    def draw_snack(self, snack, colour=None):
+        if self.visible(snack.gx, snack.gy):
+            super().draw_snack(snack, colour)
+
+    def draw_slide(self, p, ox, oy, along):
+        if not (self.visible(ox, oy) or self.visible(p.gx, p.gy)):
+            return None
+        # a head sliding into or out of view stays inside the arena
+        self.screen.set_clip(self.game_area)
+        rect = super().draw_slide(p, ox, oy, along)
+        self.screen.set_clip(None)
+        return rect
+
+    def erase_slide(self, p, rect, ox, oy):
+        if rect is None:
+            self.draw_seg(ox, oy, p.colour)
         else:
-            dx,dy = self.dx, self.dy
+            super().erase_slide(p, rect, ox, oy)
 
-        # if about to crash then turn if it helps
-        gval_infront = self.gbox.grid_val(self.gx + dx, self.gy + dy)
-        if gval_infront and gval_infront < GVAL_SNACK:
-            for dx, dy in turn_options:
-                if self.gbox.grid_val(self.gx + dx, self.gy + dy) == GVAL_CLEAR:
-                    break
+    def draw_crash(self, p):
+        if self.visible(p.gx - p.dx, p.gy - p.dy):
+            super().draw_crash(p)
 
-        self.set_direction(dx, dy)
-        super().move()
-
-
-def play(gbox, p1, p2):
-
-    snack = None
-    play_chomp = False
-    display_game_status(gbox.screen, p1, p2)
+    def follow(self, p, players):
+        """
+        Scroll to centre a player whose head comes near the edge of the view,
+        showing no more than the border around the board
+        :return:    True when the view scrolled and was redrawn
+        """
+        x, y = p.gx - self.camera_x, p.gy - self.camera_y
+        if (self.MARGIN < x <= self.VIEW_XCELLS - self.MARGIN and
+                self.MARGIN < y <= self.VIEW_YCELLS - self.MARGIN):
+            return False
+        camera = (min(max(p.gx - self.VIEW_XCELLS // 2, -1), self.xsize - self.VIEW_XCELLS),
+                  min(max(p.gy - self.VIEW_YCELLS // 2, -1), self.ysize - self.VIEW_YCELLS))
+        if camera == (self.camera_x, self.camera_y):
+            return False
+        self.camera_x, self.camera_y = camera
+        self.redraw(players)
+        return True
+
+    def redraw(self, players):
+        """
+        Draw the view from scratch, cell by cell
+        """
+        dirty.add(pygame.draw.rect(self.screen, BLACK, self.game_area))
+        draw_seg = super().draw_seg
+        for gx in range(self.camera_x + 1, self.camera_x + self.VIEW_XCELLS + 1):
+            for gy in range(self.camera_y + 1, self.camera_y + self.VIEW_YCELLS + 1):
+                if self.grid_val(gx, gy) == engine.GVAL_CLEAR:
+                    continue
+                colour = self.colours.get(gx * self.ycells + gy)
+                if colour:
+                    draw_seg(gx, gy, colour)
+                elif gx in (0, self.xsize) or gy in (0, self.ysize):
+                    draw_seg(gx, gy, WHITE)
+        if self.snack_location and self.visible(*self.snack_location):
+            gx, gy = self.snack_location
+            dirty.add(self.screen.blit(sprite_cache.snack(SNACK_COLOURS[self.snack_value]),
+                                       (self.screen_x(gx)+10, self.screen_y(gy)+10)))
+        for p in players:
+            if self.visible(p.gx, p.gy):
+                draw_seg(p.gx, p.gy, p.colour)
+
+
+def play(gbox, match, recorder=None, rate=TICK_RATE):
+    """
+    Play a game - the match ticks at a fixed rate while the screen redraws
+    every frame, sliding the heads between cells
+    :param rate:    game ticks per second
+    """
+    display_game_status(gbox.screen, match.players)
+    gbox.follow(match.players[0], match.players)
 
     # Caterpillar Walk - Copyright Nicole Corriveau 2020, permission granted to use in Snackade
     background_loop = NoteLoop([('F3',5), ('C3',5), ('A3b',5), ('C3',5), ('C2',5), ('C3',5), ('A3b',5),
                                 ('C3',5), ('F3',5), ('C3',5), ('A3b',5), ('C3',5), ('C2',5), ('D2',5),
                                 ('E2b',5), ('E2',5)])
 
-    # update sounds and screen only every 2 ticks
-    update_cycle = True
+    period = 1000 / rate
+    # time since the last tick, in milliseconds
+    lag = 0
+    # cell each head is sliding from, and where it was last drawn
+    origins = {p: p.location() for p in match.players}
+    slides = {}
+    clock.tick()
     while True:
-        # 10 ticks allowed per second
-        clock.tick(10)
-        update_cycle = not update_cycle
+        profiler.begin_frame()
+        # keep up with ticks missed over a slow frame, but only so far
+        lag = min(lag + clock.tick(FRAME_RATE), period * MAX_CATCHUP)
+        profiler.mark(WAIT)
 
         for event in pygame.event.get():
             if event.type == pygame.QUIT:
                 quit()
 
-            # check if key press matches a player mover key and update direction if matched
+            # queue a key press matching a player mover key, so each turn gets a tick
             elif event.type == pygame.KEYDOWN:
-                for p in [p1,p2]:
+                if event.key == pygame.K_F3:
+                    profiler.toggle(gbox.screen)
+                for p in match.players:
                     if event.key in p.move_key:
-                        dx, dy = p.move_key[event.key]
-                        p.set_direction(dx,dy)
-
-        # are we on the second cycle?
-        if not update_cycle:
-            continue
+                        p.queue_direction(*p.move_key[event.key])
+        profiler.mark(EVENTS)
+
+        for p in match.alive:
+            if p in slides:
+                gbox.erase_slide(p, slides.pop(p), *origins[p])
+        profiler.mark(DRAW)
+
+        while lag >= period:
+            lag -= period
+            background_loop.play_next()
+            profiler.mark(SOUND)
+
+            moving = match.alive
+            origins = {p: p.location() for p in moving}
+            result = match.tick()
+            if recorder:
+                recorder.record()
+            profiler.mark(TICK)
+
+            # erase the snack before drawing a head over it
+            if result.snack_cleared:
+                gbox.draw_snack(result.snack_cleared, BLACK)
+            if result.snack_placed:
+                gbox.draw_snack(result.snack_placed)
+
+            # the cells the heads left are body now
+            for p in moving:
+                gbox.draw_seg(*origins[p], p.colour)
+                gbox.erase_tail(p)
+
+            for p in result.crashed:
+                gbox.draw_crash(p)
+            # a big board scrolls to keep the first player in view
+            gbox.follow(match.players[0], match.players)
+            if result.chomped:
+                display_game_status(gbox.screen, match.players)
+                profiler.mark(DRAW)
+                sound_chomp()
+                profiler.mark(SOUND)
+            profiler.mark(DRAW)
+
+            if result.game_over:
+                for p in match.alive:
+                    gbox.draw_head(p)
+                if recorder:
+                    recorder.finish(result)
+                sound_crash()
+                end_game(gbox.screen, match)
+                return
+            if result.crashed:
+                sound_crash()
+
+        along = lag / period
+        for p in match.alive:
+            slides[p] = gbox.draw_slide(p, *origins[p], along)
+        profiler.mark(DRAW)
+
+        # one flush of just the areas drawn this frame
+        dirty.flush()
+        profiler.mark(FLUSH)
+        profiler.end_frame(gbox.screen, match.ticks)
+
+
+def draw_tick(gbox, match, moving, result):
+    """
+    Draw the changes of a tick, whole cells at a time
+    :param moving:  players that were still in before the tick
+    :param result:  TickResult of the tick
+    """
+    if result.snack_cleared:
+        gbox.draw_snack(result.snack_cleared, BLACK)
+    if result.snack_placed:
+        gbox.draw_snack(result.snack_placed)
+    for p in result.crashed:
+        gbox.draw_crash(p)
+    if result.chomped:
+        display_game_status(gbox.screen, match.players)
+    for p in moving:
+        if p not in result.crashed:
+            gbox.draw_player(p)
+
+
+def play_network(gbox, net):
+    """
+    Play a networked game - the server paces the ticks, keys go to the server
+    :param gbox:    game box of the match the network client steps
+    :param net:     netplay.ClientThread
+    """
+    match = net.client.match
+    while True:
+        clock.tick(30)
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                quit()
 
-        background_loop.play_next()
+            # either set of keys steers this client's player
+            elif event.type == pygame.KEYDOWN:
+                for p in match.players:
+                    if event.key in p.move_key:
+                        net.send_direction(p.move_key[event.key])
 
-        # random snack event to create or remove snack
-        if randint(1, 15) == 15:
-            if snack:
-                if randint(1, 5) == 5:
-                    snack.clear()
-                    snack = None
+        while True:
+            try:
+                kind, update = net.events.get_nowait()
+            except queue.Empty:
+                break
+            if kind == 'closed':
+                return
+            elif kind == 'start':
+                net.client.start(update)
+                gbox.clear_game_area()
+                for p in match.players:
+                    gbox.draw_head(p)
+                display_game_status(gbox.screen, match.players)
+                sound_start()
             else:
-                snack = Snack(gbox)
-
-        # first move to new positions
-        p1.move()
-        p2.move()
-
-        # update player statuses
-        for p in [p1, p2]:
-            p.update_status()
-            if p.status == Player.Status.COLLISION:
-                p.draw_crash()
-            elif p.status == Player.Status.CHOMP:
-                p.grow(snack.value, snack.value)
-                snack.clear()
-                snack = None
-                play_chomp = True
-                display_game_status(gbox.screen, p1, p2)
-
-        # Check for crashes
-        p1crash = p1.status == Player.Status.COLLISION
-        p2crash = p2.status == Player.Status.COLLISION
-
-        # update positions if not crashed
-        for p in [p1, p2]:
-            if not p.status == Player.Status.COLLISION:
-                p.draw()
-
-        if p1crash or p2crash:
-            sound_crash()
-            end_game(gbox.screen, p1crash, p2crash)
-            if not p1crash:
-                p1.wins += 1
-            if not p2crash:
-                p2.wins +=1
-            return
+                moving = match.alive
+                result = net.client.step(update)
+                draw_tick(gbox, match, moving, result)
+                if result.chomped:
+                    sound_chomp()
+                if result.game_over:
+                    sound_crash()
+                    end_game(gbox.screen, match)
+                    display_game_status(gbox.screen, match.players)
 
-        pygame.display.update()
-        # play chomp after updating the screen to keep animation smooth
-        if play_chomp:
-            sound_chomp()
-            play_chomp = False
+        dirty.flush()
 
 
 def main():
-    screen = pygame.display.set_mode((750, 580))
-    gbox = GameBox(screen)
+    screen = init()
+    # SNACKADE_BOARD=1000x1000 plays on a board of that size, scrolling to
+    # follow Green, though network games are always on the standard board
+    board = os.environ.get('SNACKADE_BOARD')
+    if board and not os.environ.get('SNACKADE_SERVER'):
+        xsize, ysize = (int(n) for n in board.lower().split('x'))
+        gbox = LargeGameBox(screen, xsize, ysize)
+    else:
+        gbox = GameBox(screen)
     gbox.display_border()
-    p1 = Player(gbox, 1, 4, GREEN, ['w','s','a','d'])
-    p2 = Player(gbox, 22, 4, BLUE, ['i','k','j','l'])
-    computer_plays = intro_select(screen)
-    if computer_plays:
+    (p1x, p1y), _ = START_POSITIONS[0]
+    (p2x, p2y), _ = START_POSITIONS[1]
+    p1 = Player(gbox, p1x, p1y, GREEN, ['w','s','a','d'])
+    p2 = Player(gbox, p2x, p2y, BLUE, ['i','k','j','l'])
+    gbox.draw_head(p1)
+    gbox.draw_head(p2)
+    # SNACKADE_PROFILE=1 shows start up and frame timings (F3 while playing),
+    # SNACKADE_PROFILE_CSV=file saves the frame timings
+    if os.environ.get('SNACKADE_PROFILE_CSV'):
+        profiler.open_csv(os.environ['SNACKADE_PROFILE_CSV'])
+    elif os.environ.get('SNACKADE_PROFILE'):
+        profiler.enabled = True
+
+    # SNACKADE_SERVER=host:port plays head to head against a netplay.py server
+    server = os.environ.get('SNACKADE_SERVER')
+    if server:
+        from netplay import ClientThread
+        host, port = server.rsplit(':', 1)
+        play_network(gbox, ClientThread(Match(gbox, [p1, p2]), host, int(port)))
+        sound_scheduler.stop()
+        pygame.quit()
+        return
+
+    mode = intro_select(screen)
+    if profiler.enabled:
+        print(startup.report())
+    if mode != 'h':
         gbox.grid_reset()
-        p1 = Player(gbox, 1, 4, GREEN, ['w','s','a','d'])
-        p2 = ComputerPlayer(gbox, 22, 4, BLUE)
+        p1 = Player(gbox, p1x, p1y, GREEN, ['w','s','a','d'])
+        # the stronger computers search the standard board only
+        if mode == 'c' or isinstance(gbox, LargeGameBox):
+            p2 = ComputerPlayer(gbox, p2x, p2y, BLUE)
+        else:
+            # the stronger computers and their process pool load only when picked
+            from ai import LookaheadPlayer, MCTSPlayer
+            p2 = (LookaheadPlayer if mode == 'e' else MCTSPlayer)(gbox, p2x, p2y, BLUE)
+    # SNACKADE_PLAYERS=n fills an arena of up to MAX_PLAYERS with more computer players
+    players = max(2, min(int(os.environ.get('SNACKADE_PLAYERS', 2)), MAX_PLAYERS))
+    others = [ComputerPlayer(gbox, gx, gy, colour)
+              for ((gx, gy), d), colour in zip(gbox.start_positions(players)[2:], PLAYER_COLOURS[2:])]
+    match = Match(gbox, [p1, p2] + others)
+    match.reset()
+    for p in others:
+        gbox.draw_head(p)
+    # SNACKADE_TICK_RATE sets the game speed in moves per second
+    rate = float(os.environ.get('SNACKADE_TICK_RATE', TICK_RATE))
+    # save a replay of every game when SNACKADE_REPLAY_DIR is set, replays
+    # are of the standard board only
+    replay_dir = os.environ.get('SNACKADE_REPLAY_DIR')
+    if isinstance(gbox, LargeGameBox):
+        replay_dir = None
+    if replay_dir:
+        os.makedirs(replay_dir, exist_ok=True)
     while True:
-        p1.set_direction(1, 0)
-        p2.set_direction(-1, 0)
-        pygame.display.update()
+        dirty.flush()
         sound_start()
-        play(gbox, p1, p2)
-        display_game_status(screen, p1, p2)
+        # let the start sweep finish before the players take off
+        wait_sounds()
+        if replay_dir:
+            with open(os.path.join(replay_dir, '{}.snkr'.format(match.seed)), 'wb') as f:
+                play(gbox, match, ReplayWriter(f, match), rate)
+        else:
+            play(gbox, match, rate=rate)
+        display_game_status(screen, match.players)
         if play_again(screen):
-            gbox.grid_reset()
+            match.reset()
             gbox.clear_game_area()
-            p1.set_head(1, 4)
-            p2.set_head(22 ,4)
+            for p in match.players:
+                gbox.draw_head(p)
         else:
             break
+    # large boards swap the MCTS player for a plain computer player
+    if mode == 'm' and hasattr(p2, 'close'):
+        p2.close()
+    sound_scheduler.stop()
     pygame.quit()
 
 if __name__ == '__main__':
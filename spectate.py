@@ -0,0 +1,276 @@
+#!/usr/bin/python3
+"""
+  Snackade spectating - stream live matches to any number of viewers
+
+  A Broadcaster watches a match and after every tick sends viewers just the
+  grid cells that changed, as collected by the game box journal, with the
+  heads and any scores that changed. Keyframes carry the whole board and go
+  out when a game starts, to viewers that just joined or fell behind, and
+  every KEYFRAME_INTERVAL ticks. Each message is encoded once and the same
+  bytes written to every viewer, and a viewer whose socket is backed up is
+  skipped until it can take a keyframe, so slow viewers never hold up the
+  game.
+
+      python spectate.py serve --port 7778 --players 4
+      python spectate.py watch --port 7778
+      python netplay.py server --spectate-port 7778    # watch network games
+
+  Messages start with their length (2 bytes), all little endian:
+
+      K  keyframe  tick, players, head cell per player, the grid, then
+                   points and wins per player
+      D  delta     tick, players, changed cell count, head cell per player,
+                   cell and new value per changed cell, changed score count,
+                   player and points per changed score
+
+MIT License - see snackade.py
+"""
+
+import argparse
+import asyncio
+import struct
+
+from engine import (GRID_CELLS, GRID_YCELLS, TICK_RATE, ComputerPlayer, GameBox, Match,
+                    grid_cell, start_positions)
+
+# Ticks between keyframes, and how much unsent data a viewer can have before it is skipped
+KEYFRAME_INTERVAL = 50
+MAX_BUFFER = 64 * 1024
+# Seconds between games
+RESTART_DELAY = 2.0
+
+LENGTH = struct.Struct('<H')
+KEY_HEADER = struct.Struct('<cIB')
+DELTA_HEADER = struct.Struct('<cIBH')
+CELL = struct.Struct('<HB')
+SCORE = struct.Struct('<BH')
+
+
+class Broadcaster:
+    """
+    Streams a match to connected viewers, call publish() after each tick
+    """
+    def __init__(self, interval=KEYFRAME_INTERVAL, max_buffer=MAX_BUFFER):
+        self.interval = interval
+        self.max_buffer = max_buffer
+        self.match = None
+        # viewer writer -> True when it needs a keyframe next
+        self.viewers = {}
+        self.points = []
+        self.keyframes = 0
+        self.deltas = 0
+        self.skipped = 0
+
+    def attach(self, match):
+        """
+        Start streaming a match, viewers get a keyframe on the next publish()
+        """
+        if self.match:
+            self.match.gbox.journal = None
+        self.match = match
+        match.gbox.journal = []
+        self.points = [p.points for p in match.players]
+        for writer in self.viewers:
+            self.viewers[writer] = True
+
+    def _heads(self):
+        return struct.pack('<{}H'.format(len(self.match.players)),
+                           *(grid_cell(p.gx, p.gy) for p in self.match.players))
+
+    def keyframe(self):
+        match = self.match
+        players = len(match.players)
+        body = b''.join([KEY_HEADER.pack(b'K', match.ticks, players), self._heads(), match.gbox.grid,
+                         struct.pack('<{}H'.format(2 * players),
+                                     *(n for p in match.players for n in (p.points, p.wins)))])
+        return LENGTH.pack(len(body)) + body
+
+    def delta(self, cells, scores):
+        match = self.match
+        grid = match.gbox.grid
+        body = b''.join([DELTA_HEADER.pack(b'D', match.ticks, len(match.players), len(cells)),
+                         self._heads()] +
+                        [CELL.pack(cell, grid[cell]) for cell in cells] +
+                        [bytes([len(scores)])] + [SCORE.pack(i, points) for i, points in scores])
+        return LENGTH.pack(len(body)) + body
+
+    def publish(self):
+        """
+        Send the tick just played to every viewer
+        """
+        match = self.match
+        journal = match.gbox.journal
+        # a cell can change several times a tick, only its final value goes out
+        cells = list(dict.fromkeys(journal))
+        journal.clear()
+        scores = [(i, p.points) for i, (p, points) in enumerate(zip(match.players, self.points))
+                  if p.points != points]
+        for i, points in scores:
+            self.points[i] = points
+
+        periodic = match.ticks % self.interval == 0
+        key = delta = None
+        for writer, needs_key in self.viewers.items():
+            if writer.transport.get_write_buffer_size() > self.max_buffer:
+                self.viewers[writer] = True
+                self.skipped += 1
+            elif needs_key or periodic:
+                if key is None:
+                    key = self.keyframe()
+                    self.keyframes += 1
+                writer.write(key)
+                self.viewers[writer] = False
+            else:
+                if delta is None:
+                    delta = self.delta(cells, scores)
+                    self.deltas += 1
+                writer.write(delta)
+
+    async def _viewer(self, reader, writer):
+        self.viewers[writer] = True
+        try:
+            # viewers only listen, wait for them to hang up
+            while await reader.read(1024):
+                pass
+        except ConnectionError:
+            pass
+        finally:
+            del self.viewers[writer]
+            writer.close()
+
+    async def serve(self, host='localhost', port=7778):
+        """
+        Accept viewers until cancelled
+        """
+        # a deep accept queue so a crowd joining at once all get in
+        server = await asyncio.start_server(self._viewer, host, port, backlog=1024)
+        async with server:
+            await server.serve_forever()
+
+
+class Spectator:
+    """
+    Rebuilds the streamed board from keyframes and deltas
+    """
+    def __init__(self):
+        self.grid = bytearray(GRID_CELLS)
+        self.tick = 0
+        self.heads = []
+        self.points = []
+        self.wins = []
+        self.synced = False
+
+    def apply(self, message):
+        """
+        Apply one message, without its length
+        :return:    message kind, b'K' or b'D'
+        """
+        kind = message[:1]
+        if kind == b'K':
+            _, self.tick, players = KEY_HEADER.unpack_from(message)
+            offset = KEY_HEADER.size
+            self.heads = list(struct.unpack_from('<{}H'.format(players), message, offset))
+            offset += 2 * players
+            self.grid[:] = message[offset:offset + GRID_CELLS]
+            scores = struct.unpack_from('<{}H'.format(2 * players), message, offset + GRID_CELLS)
+            self.points, self.wins = list(scores[0::2]), list(scores[1::2])
+            self.synced = True
+        elif self.synced:
+            _, self.tick, players, count = DELTA_HEADER.unpack_from(message)
+            offset = DELTA_HEADER.size
+            self.heads = list(struct.unpack_from('<{}H'.format(players), message, offset))
+            offset += 2 * players
+            for i in range(count):
+                cell, value = CELL.unpack_from(message, offset)
+                self.grid[cell] = value
+                offset += CELL.size
+            for i in range(message[offset]):
+                player, points = SCORE.unpack_from(message, offset + 1 + i * SCORE.size)
+                self.points[player] = points
+        return kind
+
+    def head_locations(self):
+        return [divmod(cell, GRID_YCELLS) for cell in self.heads]
+
+
+async def read_frame(reader):
+    length, = LENGTH.unpack(await reader.readexactly(LENGTH.size))
+    return await reader.readexactly(length)
+
+
+async def watch(host, port, on_message=None):
+    """
+    Follow a broadcast until it closes
+    :param on_message:  called with the Spectator and message kind after each message
+    """
+    reader, writer = await asyncio.open_connection(host, port)
+    spectator = Spectator()
+    try:
+        while True:
+            kind = spectator.apply(await read_frame(reader))
+            if on_message:
+                on_message(spectator, kind)
+    except (asyncio.IncompleteReadError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+    return spectator
+
+
+async def play_matches(broadcaster, players=2, rate=TICK_RATE, games=None):
+    """
+    Play computer matches at the game tick rate for the broadcaster to stream
+    :param games:   number of games to play, None for no limit
+    """
+    gbox = GameBox()
+    match = Match(gbox, [ComputerPlayer(gbox, gx, gy, None) for (gx, gy), d in start_positions(players)])
+    loop = asyncio.get_running_loop()
+    period = 1 / rate
+    played = 0
+    while games is None or played < games:
+        match.reset()
+        broadcaster.attach(match)
+        broadcaster.publish()
+        deadline = loop.time()
+        while True:
+            deadline += period
+            await asyncio.sleep(max(deadline - loop.time(), 0))
+            result = match.tick()
+            broadcaster.publish()
+            if result.game_over:
+                break
+        played += 1
+        await asyncio.sleep(RESTART_DELAY)
+
+
+async def serve(host, port, players, rate, games):
+    broadcaster = Broadcaster()
+    server = asyncio.ensure_future(broadcaster.serve(host, port))
+    try:
+        await play_matches(broadcaster, players, rate, games)
+    finally:
+        server.cancel()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Snackade spectating')
+    parser.add_argument('mode', choices=['serve', 'watch'])
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=7778)
+    parser.add_argument('--players', type=int, default=2, help='computer players per match when serving')
+    parser.add_argument('--rate', type=float, default=TICK_RATE, help='ticks per second when serving')
+    parser.add_argument('--games', type=int, default=None, help='games to serve, default no limit')
+    args = parser.parse_args()
+    if args.mode == 'serve':
+        asyncio.run(serve(args.host, args.port, args.players, args.rate, args.games))
+    else:
+        def show(spectator, kind):
+            if kind == b'K' and spectator.tick == 0:
+                print('new game, wins {}'.format(spectator.wins))
+            elif kind == b'D':
+                print('tick {:5d}  points {}'.format(spectator.tick, spectator.points), end='\r')
+        asyncio.run(watch(args.host, args.port, show))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,195 @@
+#!/usr/bin/python3
+"""
+  Snackade tournament - play computer players against each other
+
+  Runs seeded headless matches between every pair of policies on a pool of
+  worker processes and reports win/draw rates with 95% confidence intervals,
+  per move decision latency percentiles and matches per second, and for
+  the MCTS player the rollouts it runs per second of decision time, one
+  search process per match, to size machines by:
+
+      python tournament.py computer lookahead straight --matches 2000
+      python tournament.py mcts computer --matches 100
+
+MIT License - see snackade.py
+"""
+
+import argparse
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+from itertools import combinations
+from time import perf_counter
+
+from engine import START_POSITIONS, ComputerPlayer, GameBox, Match, Player
+from ai import LookaheadPlayer, MCTSPlayer
+from replay import ReplayWriter
+
+# Policy name -> function making a player at a start position
+POLICIES = {
+    'computer': lambda gbox, gx, gy: ComputerPlayer(gbox, gx, gy, None),
+    'straight': lambda gbox, gx, gy: Player(gbox, gx, gy, None, []),
+    'lookahead': lambda gbox, gx, gy: LookaheadPlayer(gbox, gx, gy, None),
+    'lookahead-shallow': lambda gbox, gx, gy: LookaheadPlayer(gbox, gx, gy, None, max_depth=2),
+    # one search process, the tournament already spreads matches over the cores
+    'mcts': lambda gbox, gx, gy: MCTSPlayer(gbox, gx, gy, None, workers=1),
+}
+
+# z for a 95% confidence interval
+Z95 = 1.96
+
+
+def wilson(successes, trials, z=Z95):
+    """
+    Wilson score interval for a rate
+    :return:    low, high
+    """
+    if not trials:
+        return 0.0, 0.0
+    rate = successes / trials
+    denom = 1 + z * z / trials
+    centre = (rate + z * z / (2 * trials)) / denom
+    spread = z * math.sqrt(rate * (1 - rate) / trials + z * z / (4 * trials * trials)) / denom
+    return max(centre - spread, 0.0), min(centre + spread, 1.0)
+
+
+def percentile(ordered, fraction):
+    if not ordered:
+        return 0.0
+    return ordered[min(int(fraction * len(ordered)), len(ordered) - 1)]
+
+
+def timed(move, latencies):
+    # wrap a player's move to record how long each decision takes
+    def timed_move():
+        start = perf_counter()
+        move()
+        latencies.append(perf_counter() - start)
+    return timed_move
+
+
+def play_match(job):
+    """
+    Play one seeded match
+    :param job:     (seed, policy names in START_POSITIONS order, max ticks,
+                    directory to save the replay in or None)
+    :return:        (index of winner or None for a draw, ticks, latencies per player,
+                    MCTS rollouts per player)
+    """
+    seed, names, max_ticks, replays = job
+    gbox = GameBox()
+    players = [POLICIES[name](gbox, gx, gy) for name, ((gx, gy), d) in zip(names, START_POSITIONS)]
+    latencies = [[] for p in players]
+    for p, samples in zip(players, latencies):
+        p.move = timed(p.move, samples)
+    match = Match(gbox, players)
+    match.reset(seed)
+    try:
+        if replays:
+            with open(os.path.join(replays, '{}-{}-{}.snkr'.format(seed, *names)), 'wb') as f:
+                writer = ReplayWriter(f, match)
+                while True:
+                    result = match.tick()
+                    writer.record()
+                    if result.game_over or match.ticks >= max_ticks:
+                        break
+                writer.finish(result)
+        else:
+            result = match.run(max_ticks)
+    finally:
+        # MCTS players each have a search process to stop
+        for p in players:
+            if isinstance(p, MCTSPlayer):
+                p.close()
+    rollouts = [getattr(p, 'total_rollouts', 0) for p in players]
+
+    winner = None
+    if len(result.crashed) == 1:
+        winner = 1 - players.index(result.crashed[0])
+    return winner, match.ticks, latencies, rollouts
+
+
+def run_pairing(pool, a, b, matches, seed, max_ticks, replays=None):
+    """
+    Play a pairing, swapping start sides every other match
+    :return:    dict of results for a
+    """
+    jobs = []
+    for i in range(matches):
+        names = (a, b) if i % 2 == 0 else (b, a)
+        jobs.append((seed + i, names, max_ticks, replays))
+
+    wins = draws = ticks = 0
+    latencies = {a: [], b: []}
+    rollouts = {a: 0, b: 0}
+    for (s, names, t, r), (winner, match_ticks, samples, counts) in \
+            zip(jobs, pool.map(play_match, jobs, chunksize=max(matches // 64, 1))):
+        ticks += match_ticks
+        if winner is None:
+            draws += 1
+        elif names[winner] == a:
+            wins += 1
+        for name, times, count in zip(names, samples, counts):
+            latencies[name].extend(times)
+            rollouts[name] += count
+    return {'wins': wins, 'draws': draws, 'losses': matches - wins - draws,
+            'ticks': ticks, 'latencies': latencies, 'rollouts': rollouts}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Play Snackade computer players against each other')
+    parser.add_argument('policies', nargs='+', choices=sorted(POLICIES),
+                        help='policies to play round robin')
+    parser.add_argument('--matches', type=int, default=1000, help='matches per pairing')
+    parser.add_argument('--workers', type=int, default=None, help='worker processes, default one per core')
+    parser.add_argument('--seed', type=int, default=1, help='seed of the first match')
+    parser.add_argument('--max-ticks', type=int, default=5000, help='ticks before a match is a draw')
+    parser.add_argument('--replays', default=None, help='directory to save match replays in')
+    args = parser.parse_args()
+    if args.replays:
+        os.makedirs(args.replays, exist_ok=True)
+
+    pairings = list(combinations(args.policies, 2)) or [(args.policies[0], args.policies[0])]
+    latencies = {name: [] for name in args.policies}
+    rollouts = {name: 0 for name in args.policies}
+    total_matches = total_ticks = 0
+    started = perf_counter()
+    with ProcessPoolExecutor(args.workers) as pool:
+        for a, b in pairings:
+            pair_start = perf_counter()
+            result = run_pairing(pool, a, b, args.matches, args.seed, args.max_ticks, args.replays)
+            elapsed = perf_counter() - pair_start
+            total_matches += args.matches
+            total_ticks += result['ticks']
+            for name, times in result['latencies'].items():
+                latencies[name].extend(times)
+            for name, count in result['rollouts'].items():
+                rollouts[name] += count
+
+            win_low, win_high = wilson(result['wins'], args.matches)
+            draw_low, draw_high = wilson(result['draws'], args.matches)
+            print('{} vs {}: {} matches, {:.1f} matches/s'.format(a, b, args.matches, args.matches / elapsed))
+            print('  {} wins {:5.1%} [{:.1%}, {:.1%}]  draws {:5.1%} [{:.1%}, {:.1%}]  losses {:5.1%}'.format(
+                a, result['wins'] / args.matches, win_low, win_high,
+                result['draws'] / args.matches, draw_low, draw_high,
+                result['losses'] / args.matches))
+    elapsed = perf_counter() - started
+
+    print('\ndecision latency (ms)       p50      p99      max')
+    for name in args.policies:
+        ordered = sorted(latencies[name])
+        print('  {:22s} {:8.3f} {:8.3f} {:8.3f}'.format(
+            name, percentile(ordered, 0.5) * 1000, percentile(ordered, 0.99) * 1000,
+            (ordered[-1] if ordered else 0.0) * 1000))
+    searched = [name for name in args.policies if rollouts[name]]
+    if searched:
+        print('\nrollouts                 total    per second per process')
+        for name in searched:
+            print('  {:18s} {:10d} {:12.0f}'.format(name, rollouts[name],
+                                                    rollouts[name] / max(sum(latencies[name]), 1e-9)))
+    print('\n{} matches, {} ticks in {:.1f}s: {:.1f} matches/s, {:.0f} ticks/s'.format(
+        total_matches, total_ticks, elapsed, total_matches / elapsed, total_ticks / elapsed))
+
+
+if __name__ == '__main__':
+    main()